@@ -11,15 +11,26 @@ Output: Unique file_name values from chunks.jsonl (one per source document).
 """
 import json
 import sys
+from collections import Counter
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # optional: C parser; stdlib json works the same, just slower
+    orjson = None
+
 _ROOT = Path(__file__).resolve().parent
 if str(_ROOT) not in sys.path:
     sys.path.insert(0, str(_ROOT))
 
 import config
+from google.api_core.exceptions import NotFound
 from google.cloud import storage
 
+# chunks.jsonl is read in blocks of this size and split on newlines (iterating the GCS reader
+# line by line would read one byte per call)
+READ_BLOCK_SIZE = 8 * 1024 * 1024
+
 
 def main():
     bucket_name = getattr(config, "CHUNKS_BUCKET", config.GCS_PDF_INPUT_BUCKET)
@@ -30,33 +41,42 @@ def main():
     client = storage.Client(project=config.PROJECT_ID)
     bucket = client.bucket(bucket_name)
     blob = bucket.blob(chunks_path)
-    if not blob.exists():
+
+    loads = orjson.loads if orjson else json.loads
+    # Counter keys are the unique source files; one hash lookup per chunk
+    chunk_count_per_file = Counter()
+    # Stream in blocks instead of pulling the whole file into one string.
+    # No exists() probe: a missing blob raises NotFound on the first read.
+    try:
+        tail = b""
+        with blob.open("rb", chunk_size=READ_BLOCK_SIZE) as f:
+            while True:
+                block = f.read(READ_BLOCK_SIZE)
+                lines = (tail + block).split(b"\n")
+                # An incomplete last line waits for the next block; at EOF it is the last record
+                tail = lines.pop() if block else b""
+                for raw in lines:
+                    if not raw.strip():
+                        continue
+                    obj = loads(raw)
+                    meta = obj.get("metadata") or {}
+                    chunk_count_per_file[meta.get("file_name") or "(unknown)"] += 1
+                if not block:
+                    break
+    except NotFound:
         print("No chunks file found. Run Phase 2 (chunking) first.")
         sys.exit(1)
 
-    data = blob.download_as_text()
-    seen_files = set()
-    chunk_count_per_file = {}
-    for line in data.strip().split("\n"):
-        if not line:
-            continue
-        obj = json.loads(line)
-        meta = obj.get("metadata") or {}
-        name = meta.get("file_name") or "(unknown)"
-        seen_files.add(name)
-        chunk_count_per_file[name] = chunk_count_per_file.get(name, 0) + 1
-
-    if not seen_files:
+    if not chunk_count_per_file:
         print("No documents found in chunks.")
         sys.exit(0)
 
     print("PDFs used for this index (from chunks):")
     print("-" * 50)
-    for i, name in enumerate(sorted(seen_files), 1):
-        count = chunk_count_per_file.get(name, 0)
+    for i, (name, count) in enumerate(sorted(chunk_count_per_file.items()), 1):
         print(f"  {i}. {name}  ({count} chunks)")
     print("-" * 50)
-    print(f"Total: {len(seen_files)} document(s)")
+    print(f"Total: {len(chunk_count_per_file)} document(s)")
 
 
 if __name__ == "__main__":
@@ -12,19 +12,57 @@ Sources (first non-empty wins):
 
 For URL streaming: config.GCS_PDF_INPUT_BUCKET (e.g. {project}-pdf-input). Others: config.GCS_BUCKET_NAME.
 """
+import functools
 import io
+import json
 import os
+import queue
+import shutil
 import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.error import HTTPError
 from urllib.parse import urlparse, unquote
 from urllib.request import Request, urlopen
 
 import config
 from google.cloud import storage
+from google.cloud.storage import transfer_manager
 from google.cloud.exceptions import NotFound, Conflict
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
 
+try:
+    import orjson
+except ImportError:  # optional: C serializer for the sync document.json; stdlib json works the same
+    orjson = None
+
+# Resumable upload chunk for streamed PDFs (multiple of 256 KiB); only one chunk is held in memory.
+# Objects of known size below it go up in a single request; larger ones use ~1.1x their size, capped.
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_CHUNK_SIZE_MAX = 16 * 1024 * 1024
+UPLOAD_CHUNK_ALIGN = 256 * 1024
+# Drive download chunk; up to DRIVE_PIPE_CHUNKS of them wait for the GCS upload (bounds memory).
+# With a known size the whole file is fetched in one request up to DRIVE_DOWNLOAD_CHUNK_SIZE_MAX.
+DRIVE_DOWNLOAD_CHUNK_SIZE = 10 * 1024 * 1024
+DRIVE_DOWNLOAD_CHUNK_SIZE_MAX = 16 * 1024 * 1024
+DRIVE_PIPE_CHUNKS = 2
+# URLs at least this large (Content-Length) are fetched as RANGE_DOWNLOAD_PARTS parallel byte
+# ranges into a temp file when the server accepts ranges; smaller ones stream straight to GCS
+RANGE_DOWNLOAD_MIN_BYTES = 32 * 1024 * 1024
+RANGE_DOWNLOAD_PARTS = 4
+# Local files at least this large are uploaded as parallel XML multipart parts (one connection each)
+PARALLEL_UPLOAD_MIN_BYTES = 32 * 1024 * 1024
+PARALLEL_UPLOAD_PART_SIZE = 16 * 1024 * 1024
+PARALLEL_UPLOAD_WORKERS = 4
+URL_READ_CHUNK_SIZE = 1024 * 1024
+# Non-seekable streams (HTTP responses, the Drive pipe) too large for one request are written under
+# this suffix and renamed once the upload is closed, so a failed copy never leaves a truncated PDF
+STREAM_STAGING_SUFFIX = ".partial"
+URL_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; DocumentPipeline/1.0)"}
+
 
 def ensure_bucket(storage_client, bucket_name):
     """Create GCS bucket if it does not exist."""
@@ -48,6 +86,114 @@ def ensure_bucket(storage_client, bucket_name):
         sys.exit(1)
 
 
+def _set_chunk_size(blob, known_size=None):
+    """Size blob's upload buffer to the object: None (one multipart request) under
+    UPLOAD_CHUNK_SIZE, else 1.1x the size rounded up to 256 KiB, capped at UPLOAD_CHUNK_SIZE_MAX.
+    Unknown size (streamed without Content-Length) keeps the UPLOAD_CHUNK_SIZE default."""
+    if known_size is None:
+        blob.chunk_size = UPLOAD_CHUNK_SIZE
+    elif known_size < UPLOAD_CHUNK_SIZE:
+        blob.chunk_size = None
+    else:
+        target = min(int(known_size * 1.1), UPLOAD_CHUNK_SIZE_MAX)
+        blob.chunk_size = -(-target // UPLOAD_CHUNK_ALIGN) * UPLOAD_CHUNK_ALIGN
+
+
+def _upload_local_pdf(blob, path, size):
+    """Upload the PDF at path to blob: PARALLEL_UPLOAD_WORKERS concurrent multipart parts from
+    PARALLEL_UPLOAD_MIN_BYTES up, else a single (size-tuned resumable or one-shot) upload."""
+    if size >= PARALLEL_UPLOAD_MIN_BYTES:
+        transfer_manager.upload_chunks_concurrently(
+            path,
+            blob,
+            content_type="application/pdf",
+            chunk_size=PARALLEL_UPLOAD_PART_SIZE,
+            worker_type=transfer_manager.THREAD,
+            max_workers=PARALLEL_UPLOAD_WORKERS,
+        )
+    else:
+        _set_chunk_size(blob, size)
+        blob.upload_from_filename(path, content_type="application/pdf")
+
+
+def _upload_stream(blob, stream, size=None):
+    """Upload a forward-only stream to blob. A known size under UPLOAD_CHUNK_SIZE goes up in one
+    request; anything else is copied through blob.open("wb"), whose resumable upload only reads
+    forward (upload_from_file's resumable path needs tell()/seek()). Only one chunk is held in memory.
+    Returns the uploaded blob."""
+    if size is not None and size < UPLOAD_CHUNK_SIZE:
+        blob.chunk_size = None
+        blob.upload_from_file(stream, content_type="application/pdf", size=size)
+        return blob
+    staging = blob.bucket.blob(blob.name + STREAM_STAGING_SUFFIX)
+    _set_chunk_size(staging, size)
+    with staging.open("wb", content_type="application/pdf", chunk_size=staging.chunk_size) as writer:
+        shutil.copyfileobj(stream, writer, URL_READ_CHUNK_SIZE)
+    return blob.bucket.rename_blob(staging, blob.name)
+
+
+def _drive_chunk_size(known_size=None) -> int:
+    """Bytes per Drive download request: the whole file (256 KiB aligned) if it fits in
+    DRIVE_DOWNLOAD_CHUNK_SIZE_MAX, else the max; DRIVE_DOWNLOAD_CHUNK_SIZE when size is unknown."""
+    if not known_size:
+        return DRIVE_DOWNLOAD_CHUNK_SIZE
+    return min(DRIVE_DOWNLOAD_CHUNK_SIZE_MAX, -(-known_size // UPLOAD_CHUNK_ALIGN) * UPLOAD_CHUNK_ALIGN)
+
+
+class _ChunkPipe(io.RawIOBase):
+    """Readable stream over byte chunks put() by another thread through a bounded queue.
+    A producer error passed to close_writer() is raised from read(), so a failed download
+    fails the upload instead of finalizing a truncated object; cancel() unblocks the producer
+    if the reading side gives up."""
+
+    def __init__(self, max_chunks: int):
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._chunk = memoryview(b"")
+        self._eof = False
+        self._error = None
+        self._cancelled = False
+
+    def readable(self):
+        return True
+
+    def put(self, data: bytes) -> None:
+        while not self._cancelled:
+            try:
+                self._queue.put(data, timeout=1)
+                return
+            except queue.Full:
+                continue
+        raise IOError("upload side of the pipe was cancelled")
+
+    def close_writer(self, error=None) -> None:
+        self._error = error
+        self._queue.put(None)
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    def readinto(self, b):
+        while not self._chunk and not self._eof:
+            item = self._queue.get()
+            if item is None:
+                if self._error is not None:
+                    raise self._error
+                self._eof = True
+            else:
+                self._chunk = memoryview(item)
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+
+@functools.lru_cache(maxsize=1)
+def get_storage_client():
+    """storage.Client for config.PROJECT_ID, built once per process and shared (thread-safe),
+    so credentials and the HTTP connection pool are reused by every GCS call."""
+    return storage.Client(project=config.PROJECT_ID)
+
+
 def get_drive_service():
     import google.auth
     creds, _ = google.auth.default()
@@ -88,36 +234,48 @@ def get_file_metadata(service, file_id):
 
 
 def stream_drive_to_gcs(service, file_id, storage_client, bucket_name, gcs_prefix, file_name=None):
-    """Stream PDF directly from Google Drive to GCS without local download."""
-    # Get file metadata if name not provided
-    if not file_name:
-        file_info = get_file_metadata(service, file_id)
-        file_name = file_info.get("name", "document.pdf")
-        file_size = int(file_info.get("size", 0))
-        print(f"   File: {file_name} ({file_size / (1024*1024):.2f} MB)")
-    
+    """Stream PDF directly from Google Drive to GCS without local download.
+    A download thread feeds chunks to the upload as they arrive, so the two overlap."""
+    # Size is always looked up: it picks the download chunk and the one-request upload for small files
+    file_info = get_file_metadata(service, file_id)
+    file_name = file_name or file_info.get("name", "document.pdf")
+    file_size = int(file_info.get("size", 0))
+    print(f"   File: {file_name} ({file_size / (1024*1024):.2f} MB)")
+
     # Stream download from Drive
     print(f"   Streaming from Drive to GCS (no local download)...")
     request = service.files().get_media(fileId=file_id)
     
-    # Download to memory in chunks
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request, chunksize=10*1024*1024)  # 10MB chunks
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-        if status:
-            print(f"   Download progress: {int(status.progress() * 100)}%")
-    
-    # Upload to GCS
-    fh.seek(0)
     blob_name = f"{gcs_prefix}/{file_name}"
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_name)
-    
-    print(f"   Uploading to GCS...")
-    blob.upload_from_file(fh, content_type="application/pdf", rewind=True)
-    
+    pipe = _ChunkPipe(DRIVE_PIPE_CHUNKS)
+
+    def download():
+        try:
+            fh = io.BytesIO()
+            downloader = MediaIoBaseDownload(fh, request, chunksize=_drive_chunk_size(file_size))
+            done = False
+            while not done:
+                status, done = downloader.next_chunk()
+                pipe.put(fh.getvalue())
+                fh.seek(0)
+                fh.truncate()
+                if status:
+                    print(f"   Download progress: {int(status.progress() * 100)}%")
+        except BaseException as e:
+            pipe.close_writer(e)
+        else:
+            pipe.close_writer()
+
+    # Upload to GCS while the download thread is still fetching
+    threading.Thread(target=download, name="drive-download", daemon=True).start()
+    try:
+        _upload_stream(blob, io.BufferedReader(pipe, buffer_size=UPLOAD_CHUNK_SIZE), file_size or None)
+    except BaseException:
+        pipe.cancel()
+        raise
+
     uri = f"gs://{bucket_name}/{blob_name}"
     print(f"   Uploaded: {uri}")
     return uri
@@ -126,14 +284,12 @@ def stream_drive_to_gcs(service, file_id, storage_client, bucket_name, gcs_prefi
 def download_file_from_drive(service, file_id, local_path):
     """Download a file from Google Drive by file ID to local_path (legacy method)."""
     request = service.files().get_media(fileId=file_id)
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-    fh.seek(0)
-    with open(local_path, "wb") as f:
-        f.write(fh.read())
+    # Chunks are written straight to the file; no in-memory copy of the whole PDF
+    with open(local_path, "wb") as fh:
+        downloader = MediaIoBaseDownload(fh, request, chunksize=DRIVE_DOWNLOAD_CHUNK_SIZE)
+        done = False
+        while not done:
+            status, done = downloader.next_chunk()
     print(f"   Downloaded to: {local_path}")
 
 
@@ -142,7 +298,7 @@ def upload_pdf_to_gcs(storage_client, local_path, bucket_name, gcs_prefix):
     blob_name = f"{gcs_prefix}/{os.path.basename(local_path)}"
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_name)
-    blob.upload_from_filename(local_path, content_type="application/pdf")
+    _upload_local_pdf(blob, local_path, os.path.getsize(local_path))
     uri = f"gs://{bucket_name}/{blob_name}"
     print(f"   Uploaded: {uri}")
     return uri
@@ -158,47 +314,104 @@ def _filename_from_url(url: str) -> str:
     return name
 
 
+def _download_ranges(url: str, size: int, path: str) -> bool:
+    """Fetch url into the pre-sized file at path as RANGE_DOWNLOAD_PARTS concurrent byte ranges,
+    each written at its own offset. False if the server answered a range with a full (200)
+    response or short data, or a range request failed; the caller then falls back to a single stream."""
+    part = -(-size // RANGE_DOWNLOAD_PARTS)
+
+    def fetch(start):
+        end = min(size, start + part) - 1
+        req = Request(url, headers={**URL_HEADERS, "Range": f"bytes={start}-{end}"})
+        try:
+            with urlopen(req, timeout=120) as resp, open(path, "r+b") as f:
+                if resp.status != 206:
+                    return False
+                f.seek(start)
+                shutil.copyfileobj(resp, f, URL_READ_CHUNK_SIZE)
+                return f.tell() == end + 1
+        except OSError as e:
+            # URLError/HTTPError, timeouts and dropped connections are all OSError
+            print(f"   Range {start}-{end} failed ({e}).")
+            return False
+
+    with ThreadPoolExecutor(max_workers=RANGE_DOWNLOAD_PARTS) as pool:
+        return all(list(pool.map(fetch, range(0, size, part))))
+
+
+def _ranged_size(url: str):
+    """Size of url if a HEAD request shows it is at least RANGE_DOWNLOAD_MIN_BYTES and served with
+    byte ranges, else None (including servers that reject HEAD). Nothing is downloaded."""
+    try:
+        with urlopen(Request(url, headers=URL_HEADERS, method="HEAD"), timeout=120) as resp:
+            size = int(resp.headers.get("Content-Length") or 0)
+            accepts_ranges = resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+    except (HTTPError, ValueError):
+        return None
+    return size if accepts_ranges and size >= RANGE_DOWNLOAD_MIN_BYTES else None
+
+
 def stream_url_to_gcs(url: str, storage_client, bucket_name: str, gcs_prefix: str) -> str:
-    """Stream PDF from HTTP(S) URL to GCS. Returns gs:// URI."""
+    """Stream PDF from HTTP(S) URL to GCS. Returns gs:// URI.
+    Large PDFs from servers that accept byte ranges are downloaded over several connections."""
     filename = _filename_from_url(url)
     blob_name = f"{gcs_prefix}/{filename}"
-    req = Request(url, headers={"User-Agent": "Mozilla/5.0 (compatible; DocumentPipeline/1.0)"})
+    bucket = storage_client.bucket(bucket_name)
+    blob = bucket.blob(blob_name)
     print(f"   Streaming: {url[:70]}...")
-    with urlopen(req, timeout=120) as resp:
-        chunk_size = 8 * 1024 * 1024  # 8 MB
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        buf = io.BytesIO()
-        total = 0
-        while True:
-            chunk = resp.read(chunk_size)
-            if not chunk:
-                break
-            buf.write(chunk)
-            total += len(chunk)
-        buf.seek(0)
-        blob.upload_from_file(buf, content_type="application/pdf", rewind=True)
+    # Probe with HEAD so the file is only fetched once, by whichever path it takes
+    size = _ranged_size(url)
+    if size is None:
+        with urlopen(Request(url, headers=URL_HEADERS), timeout=120) as resp:
+            size = int(resp.headers.get("Content-Length") or 0) or None
+            # The response is uploaded as it is read, one chunk at a time (no whole-file buffer)
+            blob = _upload_stream(blob, resp, size)
+    else:
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.truncate(size)
+            if not _download_ranges(url, size, path):
+                print("   Ranged download incomplete; downloading as a single stream.")
+                with urlopen(Request(url, headers=URL_HEADERS), timeout=120) as resp, open(path, "wb") as f:
+                    shutil.copyfileobj(resp, f, URL_READ_CHUNK_SIZE)
+                    size = f.tell()
+            _upload_local_pdf(blob, path, size)
+        finally:
+            os.remove(path)
     uri = f"gs://{bucket_name}/{blob_name}"
-    size_mb = total / (1024 * 1024)
+    # One-request uploads do not refresh blob.size; the ranged path already knows it
+    size_mb = (blob.size or size or 0) / (1024 * 1024)
     print(f"   Uploaded: {uri} ({size_mb:.2f} MB)")
     return uri
 
 
-def run_batch_process(gcs_input_uri, gcs_output_uri_prefix, timeout_seconds=600):
-    """Submit Document AI batch process (Layout Parser). Output prefix must end with /."""
+@functools.lru_cache(maxsize=1)
+def get_docai_client():
+    """Document AI client for config.DOCAI_LOCATION, built once per process (one gRPC channel,
+    safe to share across threads)."""
     from google.api_core.client_options import ClientOptions
     from google.cloud import documentai_v1 as documentai
-    
+
     opts = ClientOptions(
         api_endpoint=f"{config.DOCAI_LOCATION}-documentai.googleapis.com"
     )
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    return documentai.DocumentProcessorServiceClient(client_options=opts)
+
 
-    gcs_doc = documentai.GcsDocument(
-        gcs_uri=gcs_input_uri,
-        mime_type="application/pdf",
+def submit_batch_process(gcs_input_uri, gcs_output_uri_prefix, client=None):
+    """Submit a Document AI batch process (Layout Parser) and return its long-running
+    operation without waiting. gcs_input_uri may be one URI or a list (up to 50 PDFs in one
+    request; each gets its own numbered output folder). Output prefix must end with /."""
+    from google.cloud import documentai_v1 as documentai
+
+    if client is None:
+        client = get_docai_client()
+
+    input_uris = [gcs_input_uri] if isinstance(gcs_input_uri, str) else list(gcs_input_uri)
+    gcs_documents = documentai.GcsDocuments(
+        documents=[documentai.GcsDocument(gcs_uri=uri, mime_type="application/pdf") for uri in input_uris]
     )
-    gcs_documents = documentai.GcsDocuments(documents=[gcs_doc])
     input_config = documentai.BatchDocumentsInputConfig(gcs_documents=gcs_documents)
 
     if not gcs_output_uri_prefix.endswith("/"):
@@ -221,26 +434,28 @@ def run_batch_process(gcs_input_uri, gcs_output_uri_prefix, timeout_seconds=600)
         input_documents=input_config,
         document_output_config=output_config,
     )
+    return client.batch_process_documents(request)
 
+
+def run_batch_process(gcs_input_uri, gcs_output_uri_prefix, timeout_seconds=600, client=None):
+    """Submit Document AI batch process (Layout Parser) and wait for it. Output prefix must end with /."""
     print("   Submitting batch process (Layout Parser)...")
-    operation = client.batch_process_documents(request)
+    operation = submit_batch_process(gcs_input_uri, gcs_output_uri_prefix, client)
     print(f"   Operation: {operation.operation.name}")
     print("   Waiting for completion (may take several minutes for large PDFs)...")
     operation.result(timeout=timeout_seconds)
     return operation
 
 
-def run_sync_process(gcs_input_uri: str, gcs_output_uri_prefix: str):
+def run_sync_process(gcs_input_uri: str, gcs_output_uri_prefix: str, storage_client=None, client=None):
     """Process a single document with Document AI sync (online) API and write result to GCS.
-    Use when batch fails for one file. Sync has a 15-page / 20MB limit for Document OCR."""
-    from google.api_core.client_options import ClientOptions
+    Use when batch fails for one file. Sync has a 15-page / 20MB limit for Document OCR.
+    Pass the caller's storage_client / Document AI client to reuse their connections."""
     from google.cloud import documentai_v1 as documentai
     from google.protobuf import json_format
 
-    opts = ClientOptions(
-        api_endpoint=f"{config.DOCAI_LOCATION}-documentai.googleapis.com"
-    )
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    if client is None:
+        client = get_docai_client()
     name = client.processor_path(
         config.PROJECT_ID,
         config.DOCAI_LOCATION,
@@ -261,21 +476,26 @@ def run_sync_process(gcs_input_uri: str, gcs_output_uri_prefix: str):
     parts = prefix[5:].split("/", 1)
     bucket_name, path_prefix = parts[0], parts[1]
     blob_name = f"{path_prefix}document.json"
-    json_str = json_format.MessageToJson(response.document)
-    storage_client = storage.Client(project=config.PROJECT_ID)
+    # Same camelCase JSON as MessageToJson, but compact and serialized in C when orjson is present
+    document = json_format.MessageToDict(response.document)
+    json_bytes = orjson.dumps(document) if orjson else json.dumps(document, separators=(",", ":")).encode("utf-8")
+    if storage_client is None:
+        storage_client = get_storage_client()
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_name)
-    blob.upload_from_string(json_str, content_type="application/json")
+    _set_chunk_size(blob, len(json_bytes))
+    blob.upload_from_string(json_bytes, content_type="application/json")
     print(f"   Uploaded: gs://{bucket_name}/{blob_name}")
     return response
 
 
-def print_output_locations():
+def print_output_locations(storage_client=None):
     """List JSON output files under the known GCS output prefix."""
     bucket = config.GCS_BUCKET_NAME
     prefix = config.GCS_OUTPUT_PREFIX
-    storage_client = storage.Client(project=config.PROJECT_ID)
-    blobs = list(storage_client.list_blobs(bucket, prefix=prefix))
+    if storage_client is None:
+        storage_client = get_storage_client()
+    blobs = list(storage_client.list_blobs(bucket, prefix=prefix, fields="items(name),nextPageToken"))
     print(f"   Output prefix: gs://{bucket}/{prefix}/")
     if not blobs:
         print("   (No files yet; listing may be delayed.)")
@@ -298,7 +518,7 @@ def main():
     # Initialize storage client
     print("\n[Step 0] Connecting to Google Cloud Storage...")
     try:
-        storage_client = storage.Client(project=config.PROJECT_ID)
+        storage_client = get_storage_client()
         print(f"   Connected to project: {config.PROJECT_ID}")
     except Exception as e:
         print(f"\nERROR: Failed to connect to GCS: {e}")
@@ -322,23 +542,26 @@ def main():
     if config.PDF_URL_LIST:
         bucket_name = getattr(config, "GCS_PDF_INPUT_BUCKET", config.GCS_BUCKET_NAME)
         print("\n[Step 2] Streaming PDFs from URLs to GCS (no local download)...")
+        # Each URL is an independent download + upload; they share the (thread-safe) storage client
+        workers = max(1, min(getattr(config, "INGEST_CONCURRENCY", 8), len(config.PDF_URL_LIST)))
+        print(f"   {len(config.PDF_URL_LIST)} URL(s), {workers} at a time")
         gcs_uris = []
         failed = []
-        for i, url in enumerate(config.PDF_URL_LIST, 1):
-            filename = _filename_from_url(url)
-            print(f"\n   ({i}/{len(config.PDF_URL_LIST)}) {filename}")
-            try:
-                uri = stream_url_to_gcs(
-                    url,
-                    storage_client,
-                    bucket_name,
-                    config.GCS_INPUT_PREFIX,
-                )
-                gcs_uris.append(uri)
-            except Exception as e:
-                failed.append((filename, url, str(e)))
-                print(f"   [SKIP] {filename}: {e}")
-                print(f"   Logged; continuing with next URL.")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(stream_url_to_gcs, url, storage_client, bucket_name, config.GCS_INPUT_PREFIX): url
+                for url in config.PDF_URL_LIST
+            }
+            for i, future in enumerate(as_completed(futures), 1):
+                url = futures[future]
+                filename = _filename_from_url(url)
+                try:
+                    gcs_uris.append(future.result())
+                    print(f"   ({i}/{len(config.PDF_URL_LIST)}) Done: {filename}")
+                except Exception as e:
+                    failed.append((filename, url, str(e)))
+                    print(f"   ({i}/{len(config.PDF_URL_LIST)}) [SKIP] {filename}: {e}")
+                    print(f"   Logged; continuing with the other URLs.")
         if failed:
             print(f"\n   Failed ({len(failed)}):")
             for fn, u, err in failed:
@@ -416,7 +639,7 @@ def main():
 
         # Step 4: Output locations
         print("\n[Step 4] Output locations:")
-        print_output_locations()
+        print_output_locations(storage_client)
     elif config.PDF_URL_LIST:
         print("\n[Step 3] Streaming-only run: PDFs are in GCS. Chunking/indexing in a later step.")
     else:
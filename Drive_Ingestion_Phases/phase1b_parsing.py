@@ -12,16 +12,108 @@ Requires: DOCAI_PROCESSOR_ID set in config (Layout Parser processor).
   python phase1b_parsing.py
   python phase1b_parsing.py --only "SYM_2025_1PGR_Federation_via_Microsoft_Teams.pdf"   # retry one file
   python phase1b_parsing.py --only "file.pdf" --sync   # use sync (online) API instead of batch (15-page limit)
+  python phase1b_parsing.py --concurrency 5   # more Document AI jobs in flight
+  python phase1b_parsing.py --force   # re-parse PDFs that already have up-to-date output (--only always re-parses)
 """
 import argparse
 import os
 import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import config
-from google.cloud import storage
 
-# Reuse batch and sync logic from Phase 1
-from phase1_ingestion import run_batch_process, run_sync_process
+# Reuse batch and sync logic (and the shared clients) from Phase 1
+from phase1_ingestion import get_docai_client, get_storage_client, run_sync_process, submit_batch_process
+
+# Document AI jobs in flight at once (default for --concurrency). A request of n PDFs is waited on
+# for up to BATCH_TIMEOUT_SECONDS + n * BATCH_TIMEOUT_PER_DOCUMENT_SECONDS.
+DOCAI_CONCURRENCY = 3
+BATCH_TIMEOUT_SECONDS = 1200
+BATCH_TIMEOUT_PER_DOCUMENT_SECONDS = 300
+# Submissions are spaced so bursts stay under the processor's request quota
+DOCAI_SUBMITS_PER_SECOND = 5
+# PDFs per batch request (API limit 50). Outputs land under a staging prefix next to
+# DOCAI_OUTPUT_PREFIX and are then moved into each PDF's <stem>/ folder.
+DOCAI_BATCH_DOCUMENTS = 50
+BATCH_STAGING_SUFFIX = "-staging"
+
+
+def _gcs_path(uri: str) -> str:
+    """Object name (or prefix) part of a gs://bucket/... URI."""
+    return uri[5:].split("/", 1)[1] if uri.startswith("gs://") else uri
+
+
+def move_batch_outputs(storage_client, bucket_name: str, out_prefix: str, staging_prefix: str, operation):
+    """After a multi-PDF batch completes, move each PDF's output folder from staging_prefix
+    into out_prefix/<stem>/ (the per-document layout Phase 2 reads), using the per-document
+    statuses in the operation metadata. Returns {input blob name: output gs:// prefix or Exception}."""
+    bucket = storage_client.bucket(bucket_name)
+    results = {}
+    for status in operation.metadata.individual_process_statuses:
+        name = _gcs_path(status.input_gcs_source)
+        if status.status.code != 0:
+            results[name] = RuntimeError(status.status.message or f"Document AI status {status.status.code}")
+            continue
+        src = _gcs_path(status.output_gcs_destination).rstrip("/") + "/"
+        stem = _stem(os.path.basename(name))
+        dest = f"{out_prefix}/{stem}/{src[len(staging_prefix):]}"
+        for blob in storage_client.list_blobs(bucket_name, prefix=src):
+            bucket.rename_blob(blob, dest + blob.name[len(src):])
+        results[name] = f"gs://{bucket_name}/{out_prefix}/{stem}/"
+    return results
+
+
+def recover_staged_outputs(storage_client, docai_client, bucket_name: str, out_prefix: str, staging_prefix: str) -> int:
+    """Move outputs an earlier run left under staging_prefix (it stopped waiting on a batch that
+    later finished). Document AI names each staging folder after its operation: finished operations
+    are moved into place from their per-document statuses and the folder is cleared; operations
+    still running, or that cannot be looked up, are left alone. Returns the PDFs recovered."""
+    from google.cloud import documentai_v1 as documentai
+
+    blobs = storage_client.list_blobs(
+        bucket_name, prefix=staging_prefix, fields="items(name),nextPageToken", page_size=1000
+    )
+    operation_ids = sorted({b.name[len(staging_prefix):].split("/", 1)[0] for b in blobs})
+    recovered = 0
+    for operation_id in operation_ids:
+        name = f"projects/{config.PROJECT_ID}/locations/{config.DOCAI_LOCATION}/operations/{operation_id}"
+        try:
+            op = docai_client.get_operation({"name": name})
+        except Exception as e:
+            print(f"   WARNING: could not look up operation {operation_id} ({e}); leaving its staged output")
+            continue
+        if not op.done:
+            print(f"   Operation {operation_id} is still running; leaving its staged output")
+            continue
+        metadata = documentai.BatchProcessMetadata.deserialize(op.metadata.value)
+        results = move_batch_outputs(
+            storage_client, bucket_name, out_prefix, staging_prefix, types.SimpleNamespace(metadata=metadata)
+        )
+        recovered += sum(not isinstance(r, Exception) for r in results.values())
+        # Whatever is left belongs to failed documents; clear it so the folder is not looked up again
+        for blob in storage_client.list_blobs(bucket_name, prefix=f"{staging_prefix}{operation_id}/"):
+            blob.delete()
+    return recovered
+
+
+class _SubmitPacer:
+    """Spaces calls to wait() at least 1/per_second apart across threads."""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
 
 
 def _stem(name: str) -> str:
@@ -31,10 +123,33 @@ def _stem(name: str) -> str:
 
 
 def list_pdfs_in_bucket(storage_client, bucket_name: str, prefix: str):
-    """List blob names under prefix that end with .pdf."""
-    bucket = storage_client.bucket(bucket_name)
-    blobs = list(bucket.list_blobs(prefix=prefix))
-    return [b.name for b in blobs if b.name.lower().endswith(".pdf")]
+    """Map blob name -> last update time for blobs under prefix that end with .pdf.
+    The suffix is matched server-side (match_glob), so Document AI JSON and other siblings
+    under the prefix are never listed; only name and update time are fetched."""
+    blobs = storage_client.list_blobs(
+        bucket_name,
+        prefix=prefix,
+        match_glob=f"{prefix}**.[pP][dD][fF]",
+        fields="items(name,updated),nextPageToken",
+        page_size=1000,
+    )
+    return {b.name: b.updated for b in blobs if b.name.lower().endswith(".pdf")}
+
+
+def list_parsed_outputs(storage_client, bucket_name: str, out_prefix: str):
+    """One listing of the Document AI output prefix: map doc stem -> newest .json update time."""
+    parsed = {}
+    prefix = out_prefix + "/"
+    blobs = storage_client.list_blobs(
+        bucket_name, prefix=prefix, fields="items(name,updated),nextPageToken", page_size=1000
+    )
+    for b in blobs:
+        if not b.name.endswith(".json") or b.updated is None:
+            continue
+        stem = b.name[len(prefix):].split("/", 1)[0]
+        if stem not in parsed or b.updated > parsed[stem]:
+            parsed[stem] = b.updated
+    return parsed
 
 
 def main():
@@ -52,6 +167,17 @@ def main():
         action="store_true",
         help="Use sync (online) API instead of batch. Use for single PDFs when batch fails. Limit: ~15 pages, 20MB.",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DOCAI_CONCURRENCY,
+        help=f"PDFs processed in parallel (default {DOCAI_CONCURRENCY}). Use 1 for one-at-a-time output.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-parse every PDF, even when its output folder is newer than the PDF (implied by --only).",
+    )
     args = parser.parse_args()
 
     print("\n" + "=" * 60)
@@ -73,7 +199,7 @@ def main():
 
     print("\n[Step 1] Connecting to GCS...")
     try:
-        storage_client = storage.Client(project=config.PROJECT_ID)
+        storage_client = get_storage_client()
     except Exception as e:
         print(f"\nERROR: Failed to connect to GCS: {e}")
         sys.exit(1)
@@ -81,7 +207,8 @@ def main():
     print("\n[Step 2] Listing PDFs in bucket...")
     bucket_name = config.GCS_PDF_INPUT_BUCKET
     prefix = config.GCS_INPUT_PREFIX.rstrip("/") + "/"
-    all_pdf_names = list_pdfs_in_bucket(storage_client, bucket_name, prefix)
+    pdf_updated = list_pdfs_in_bucket(storage_client, bucket_name, prefix)
+    all_pdf_names = list(pdf_updated)
     if not all_pdf_names:
         print(f"   No PDFs found under gs://{bucket_name}/{prefix}")
         print("   Run phase1_ingestion.py first to upload PDFs.")
@@ -99,32 +226,98 @@ def main():
         print(f"   Processing only: {[os.path.basename(n) for n in pdf_names]}")
     else:
         pdf_names = all_pdf_names
+    out_prefix = config.DOCAI_OUTPUT_PREFIX.strip().rstrip("/")
+    staging_prefix = out_prefix + BATCH_STAGING_SUFFIX + "/"
+    docai_client = get_docai_client()
+    # Batches an earlier run gave up waiting on may have finished since; move their outputs first
+    # so those PDFs count as parsed below
+    recovered = recover_staged_outputs(storage_client, docai_client, bucket_name, out_prefix, staging_prefix)
+    if recovered:
+        print(f"   Recovered {recovered} parsed PDF(s) left in staging by an earlier run")
+    # PDFs named with --only are always re-parsed: that is how a bad parse is redone
+    if not args.force and not args.only:
+        # Skip PDFs whose parsed output was written after the PDF was last uploaded
+        parsed = list_parsed_outputs(storage_client, bucket_name, out_prefix)
+        fresh = []
+        for name in pdf_names:
+            parsed_at = parsed.get(_stem(os.path.basename(name)))
+            if parsed_at is not None and pdf_updated[name] is not None and parsed_at >= pdf_updated[name]:
+                print(f"   [CACHED] {os.path.basename(name)} — parsed output exists, skipping (--force to redo)")
+            else:
+                fresh.append(name)
+        pdf_names = fresh
+        if not pdf_names:
+            print("   All PDFs are already parsed. Nothing to do (use --force to re-parse).")
+            return
     if args.sync:
         print("   Mode: sync (online) — single-doc limit ~15 pages / 20MB")
     print(f"   Found {len(pdf_names)} PDF(s) to process")
 
-    print("\n[Step 3] Running Document AI Layout Parser on each PDF...")
-    out_prefix = config.DOCAI_OUTPUT_PREFIX.strip().rstrip("/")
-    succeeded = []
-    failed = []
-    for i, blob_name in enumerate(pdf_names, 1):
-        filename = os.path.basename(blob_name)
-        stem = _stem(filename)
-        gcs_input_uri = f"gs://{bucket_name}/{blob_name}"
-        gcs_output_prefix = f"gs://{bucket_name}/{out_prefix}/{stem}/"
-        print(f"\n   ({i}/{len(pdf_names)}) {filename}")
-        print(f"   Input:  {gcs_input_uri}")
-        print(f"   Output: {gcs_output_prefix}")
+    concurrency = max(1, args.concurrency)
+    pacer = _SubmitPacer(DOCAI_SUBMITS_PER_SECOND)
+    if args.sync:
+        # The online API takes one document per call
+        groups = [[name] for name in pdf_names]
+        print(f"\n[Step 3] Running Document AI Layout Parser on each PDF ({concurrency} at a time)...")
+    else:
+        # Several PDFs per batch request, split so that `concurrency` requests share the work
+        group_size = min(DOCAI_BATCH_DOCUMENTS, -(-len(pdf_names) // concurrency))
+        groups = [pdf_names[k : k + group_size] for k in range(0, len(pdf_names), group_size)]
+        print(f"\n[Step 3] Running Document AI Layout Parser: {len(pdf_names)} PDF(s) in {len(groups)} batch request(s), {concurrency} at a time...")
+
+    def parse_group(names):
+        """Returns {blob name: output gs:// prefix or Exception} for the PDFs in one request."""
+        pacer.wait()
+        if args.sync:
+            stem = _stem(os.path.basename(names[0]))
+            gcs_output_prefix = f"gs://{bucket_name}/{out_prefix}/{stem}/"
+            run_sync_process(f"gs://{bucket_name}/{names[0]}", gcs_output_prefix, storage_client, docai_client)
+            return {names[0]: gcs_output_prefix}
+        operation = submit_batch_process(
+            [f"gs://{bucket_name}/{n}" for n in names], f"gs://{bucket_name}/{staging_prefix}", docai_client
+        )
+        print(f"   Submitted {len(names)} PDF(s) (operation {operation.operation.name})")
+        timeout = BATCH_TIMEOUT_SECONDS + len(names) * BATCH_TIMEOUT_PER_DOCUMENT_SECONDS
         try:
-            if args.sync:
-                run_sync_process(gcs_input_uri, gcs_output_prefix)
-            else:
-                run_batch_process(gcs_input_uri, gcs_output_prefix, timeout_seconds=1200)
-            succeeded.append((filename, gcs_output_prefix))
+            operation.result(timeout=timeout)
         except Exception as e:
-            failed.append((filename, str(e)))
-            print(f"   [FAILED] {e}")
-            print("   Continuing with next PDF.")
+            # A timeout leaves the operation running: its statuses are incomplete and staging is still being
+            # written, so fail the group and leave staging alone; the next run moves it once finished.
+            if not operation.done():
+                raise RuntimeError(
+                    f"batch still running after {timeout}s (operation {operation.operation.name}); "
+                    "rerun to pick up its output once it finishes"
+                ) from e
+            # Partial failures still report per-document statuses; a request-level error has none
+            if not getattr(operation.metadata, "individual_process_statuses", None):
+                raise
+            print(f"   Batch request finished with errors: {e}")
+        results = move_batch_outputs(storage_client, bucket_name, out_prefix, staging_prefix, operation)
+        for n in names:
+            results.setdefault(n, RuntimeError("no status reported by Document AI"))
+        return results
+
+    # Batch jobs run server-side; the pool just keeps `concurrency` requests in flight and waits.
+    # A failed PDF is reported and the rest continue.
+    succeeded = []
+    failed = []
+    done = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(parse_group, names): names for names in groups}
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                results = {n: e for n in futures[future]}
+            for name, outcome in results.items():
+                done += 1
+                filename = os.path.basename(name)
+                if isinstance(outcome, Exception):
+                    failed.append((filename, str(outcome)))
+                    print(f"   ({done}/{len(pdf_names)}) [FAILED] {filename}: {outcome}")
+                else:
+                    succeeded.append((filename, outcome))
+                    print(f"   ({done}/{len(pdf_names)}) Done: {filename} → {outcome}")
 
     if failed:
         print(f"\n   Failed ({len(failed)}):")
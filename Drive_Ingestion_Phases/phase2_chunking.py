@@ -9,14 +9,49 @@ Input:  Document AI JSON in gs://{GCS_PDF_INPUT_BUCKET}/{DOCAI_OUTPUT_PREFIX}/<d
 Output: gs://{CHUNKS_BUCKET}/{CHUNK_OUTPUT_PREFIX}/chunks.jsonl
 
   python phase2_chunking.py
+  python phase2_chunking.py --cache   # reuse the last listing (e.g. re-chunking with a new overlap)
 """
+import argparse
+import hashlib
 import json
 import os
 import re
 import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 import config
 from google.cloud import storage
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:  # optional: C parser/serializer; stdlib json works the same, just slower
+    orjson = None
+
+# Resumable upload chunk for the streamed chunks.jsonl (must be a multiple of 256 KiB)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# chunks.jsonl is streamed to this sibling name and renamed into place once the upload is closed
+STAGING_SUFFIX = ".partial"
+# Documents downloaded/parsed concurrently (GCS download is I/O-bound; one shared storage.Client)
+DOC_WORKERS = 16
+# Step 1 listing is saved locally; --cache reuses it for repeated chunking runs (e.g. tuning overlap).
+# Opt-in because a cached listing misses documents Phase 1b parsed since it was written.
+MANIFEST_CACHE_TTL_SECONDS = 15 * 60
+
+# Numbered headings ("1.", "2.3 Scope", ...) and the blank-line splitter for the last-resort path
+_HEADER_NUM_RE = re.compile(r"^\d+(\.\d+)*\.?\s+\w")
+_DBL_NL_RE = re.compile(r"\n\s*\n")
+
+
+def _segment_bounds(seg: dict) -> tuple:
+    """(start, end) of a text segment. Indices are character offsets into document.text;
+    startIndex is omitted from the JSON when it is 0."""
+    start = int(seg.get("startIndex", seg.get("start_index", 0)))
+    end = int(seg.get("endIndex", seg.get("end_index", 0)))
+    return start, end
 
 
 def _get_text_from_anchor(doc_text: str, elem: dict) -> str:
@@ -40,10 +75,13 @@ def _get_text_from_anchor(doc_text: str, elem: dict) -> str:
     if not doc_text or not segments:
         return ""
     
+    # Most anchors are one contiguous span: slice it directly, no parts list / join
+    if len(segments) == 1:
+        start, end = _segment_bounds(segments[0])
+        return doc_text[start:end].strip() if start < end else ""
     parts = []
     for seg in segments:
-        start = int(seg.get("startIndex", seg.get("start_index", 0)))
-        end = int(seg.get("endIndex", seg.get("end_index", 0)))
+        start, end = _segment_bounds(seg)
         if start < end:
             parts.append(doc_text[start:end])
     return "".join(parts).strip()
@@ -51,12 +89,14 @@ def _get_text_from_anchor(doc_text: str, elem: dict) -> str:
 
 def _is_likely_header(text: str) -> bool:
     """Heuristic: short, no trailing period, title-like."""
-    if not text or len(text) > 120:
+    # Most paragraphs are long body text: reject on length before stripping (no allocation)
+    n = len(text)
+    if n == 0 or n > 120:
         return False
     t = text.strip()
-    if not t or t.endswith(".") or t.endswith(":"):
+    if not t or t[-1] in ".:":
         return False
-    if re.match(r"^\d+(\.\d+)*\.?\s+\w", t):
+    if t[0].isdigit() and _HEADER_NUM_RE.match(t):
         return True
     if t.isupper() and len(t) < 80:
         return True
@@ -75,8 +115,11 @@ def _table_to_markdown(table: dict, doc_text: str) -> str:
         return _get_text_from_anchor(doc_text, table)
 
     rows_text = []
+    n_cols = 0  # column count of the first row, for the separator line
     for row in all_rows:
         cells = row.get("cells") or []
+        if not rows_text:
+            n_cols = len(cells)
         cell_texts = []
         for cell in cells:
             ct = _get_text_from_anchor(doc_text, cell)
@@ -84,7 +127,7 @@ def _table_to_markdown(table: dict, doc_text: str) -> str:
         rows_text.append("| " + " | ".join(cell_texts) + " |")
     if not rows_text:
         return _get_text_from_anchor(doc_text, table)
-    sep = "| " + " | ".join(["---"] * max(1, len(rows_text[0].split("|")) - 2)) + " |"
+    sep = "| " + " | ".join(["---"] * max(1, n_cols)) + " |"
     return rows_text[0] + "\n" + sep + "\n" + "\n".join(rows_text[1:])
 
 
@@ -104,13 +147,29 @@ def _get_pages(doc: dict) -> list:
     return doc.get("pages") or doc.get("Pages") or []
 
 
-def _collect_elements(doc: dict, file_name: str) -> list:
-    """Return list of (page_num, type, text, section_hint) in reading order.
+# Page fields _iter_elements reads; everything else on a page (image, tokens, symbols,
+# visualElements, dimension, ...) is dropped on load
+_PAGE_KEYS = ("paragraphs", "Paragraphs", "blocks", "Blocks", "tables", "Tables", "lines", "Lines")
+
+
+def _slim_document(raw: dict) -> dict:
+    """Keep only text and the page elements chunking uses. Document AI output carries a
+    base64 page image and per-token/symbol layout on every page, which would otherwise
+    stay resident for every document waiting in the download window."""
+    doc = _unwrap_document(raw)
+    return {
+        "text": doc.get("text") or "",
+        "pages": [{k: page[k] for k in _PAGE_KEYS if k in page} for page in _get_pages(doc)],
+    }
+
+
+def _iter_elements(doc: dict, file_name: str):
+    """Yield (page_num, type, text, section_hint) in reading order.
     Supports Document OCR (lines) and Layout Parser (paragraphs, blocks, tables)."""
     doc = _unwrap_document(doc)
     full_text = doc.get("text") or ""
     pages = _get_pages(doc)
-    elements = []
+    found = False
     current_section = "Document"
 
     for page_idx, page in enumerate(pages):
@@ -122,7 +181,8 @@ def _collect_elements(doc: dict, file_name: str) -> list:
                 continue
             if _is_likely_header(text):
                 current_section = text[:100]
-            elements.append((page_num, "text", text, current_section))
+            found = True
+            yield (page_num, "text", text, current_section)
 
         # Blocks
         for block in page.get("blocks") or page.get("Blocks") or []:
@@ -131,7 +191,8 @@ def _collect_elements(doc: dict, file_name: str) -> list:
                 continue
             if _is_likely_header(text):
                 current_section = text[:100]
-            elements.append((page_num, "text", text, current_section))
+            found = True
+            yield (page_num, "text", text, current_section)
 
         # Tables
         for table in page.get("tables") or page.get("Tables") or []:
@@ -139,95 +200,191 @@ def _collect_elements(doc: dict, file_name: str) -> list:
             if not text or len(text) < 5:
                 text = _get_text_from_anchor(full_text, table)
             if text:
-                elements.append((page_num, "table", text, current_section))
+                found = True
+                yield (page_num, "table", text, current_section)
+
+    if found or not full_text.strip():
+        return
 
     # Document OCR fallback: if no paragraphs/blocks/tables, use lines per page
-    if not elements and full_text.strip():
-        for page_idx, page in enumerate(pages):
-            page_num = page_idx + 1
-            lines = page.get("lines") or page.get("Lines") or []
-            line_texts = []
-            for line in lines:
-                t = _get_text_from_anchor(full_text, line)
-                if t:
-                    line_texts.append(t)
-            if line_texts:
-                buf, buf_len = [], 0
-                for t in line_texts:
-                    buf.append(t)
-                    buf_len += len(t)
-                    if buf_len >= 200 or len(buf) >= 5:
-                        combined = "\n".join(buf)
-                        if _is_likely_header(combined):
-                            current_section = combined[:100]
-                        elements.append((page_num, "text", combined, current_section))
-                        buf, buf_len = [], 0
-                if buf:
+    for page_idx, page in enumerate(pages):
+        page_num = page_idx + 1
+        lines = page.get("lines") or page.get("Lines") or []
+        line_texts = []
+        for line in lines:
+            t = _get_text_from_anchor(full_text, line)
+            if t:
+                line_texts.append(t)
+        if line_texts:
+            buf, buf_len = [], 0
+            for t in line_texts:
+                buf.append(t)
+                buf_len += len(t)
+                if buf_len >= 200 or len(buf) >= 5:
                     combined = "\n".join(buf)
-                    if len(combined) >= 10:
-                        elements.append((page_num, "text", combined, current_section))
+                    if _is_likely_header(combined):
+                        current_section = combined[:100]
+                    found = True
+                    yield (page_num, "text", combined, current_section)
+                    buf, buf_len = [], 0
+            if buf:
+                combined = "\n".join(buf)
+                if len(combined) >= 10:
+                    found = True
+                    yield (page_num, "text", combined, current_section)
+
+    if found:
+        return
 
     # Last resort: chunk full text by double newline
-    if not elements and full_text.strip():
-        parts = re.split(r"\n\s*\n", full_text.strip())
-        for p in parts:
-            p = p.strip()
-            if len(p) >= 10:
-                elements.append((1, "text", p, "Document"))
-
-    return elements
-
-
-def _elements_to_chunks(elements: list, file_name: str, doc_label: str, min_text_chars: int = 80) -> list:
-    """Convert elements to chunks; merge very small consecutive text elements."""
-    chunks = []
-    for i, (page_num, typ, text, section) in enumerate(elements):
-        chunk_id = f"{doc_label}_p{page_num}_{typ}_{i}"
-        chunks.append({
-            "id": chunk_id,
-            "text": f"[Page {page_num} | Section: {section}]\n\n{text}",
-            "metadata": {
-                "file_name": file_name,
-                "page_number": page_num,
-                "section_title": section,
-                "type": typ,
-                "is_table": typ == "table",
-            },
-        })
-    return chunks
-
-
-def _apply_overlap(chunks: list, overlap_ratio: float) -> list:
-    """Prefix each chunk (except first) with last overlap_ratio of previous chunk."""
-    if overlap_ratio <= 0 or len(chunks) <= 1:
-        return chunks
-    out = []
-    for i, c in enumerate(chunks):
-        if i == 0:
-            out.append(c)
+    parts = _DBL_NL_RE.split(full_text.strip())
+    for p in parts:
+        p = p.strip()
+        if len(p) >= 10:
+            yield (1, "text", p, "Document")
+
+
+def _build_chunk(index: int, page_num: int, typ: str, text: str, section: str, file_name: str, doc_label: str) -> dict:
+    """One chunk record for the index-th element of a document."""
+    return {
+        "id": f"{doc_label}_p{page_num}_{typ}_{index}",
+        "text": f"[Page {page_num} | Section: {section}]\n\n{text}",
+        "metadata": {
+            "file_name": file_name,
+            "page_number": page_num,
+            "section_title": section,
+            "type": typ,
+            "is_table": typ == "table",
+        },
+    }
+
+
+def _overlap_prefix(prev_body: str, overlap_ratio: float) -> str:
+    """'... <tail>' plus a blank line, where tail is the last overlap_ratio of the previous
+    chunk's body; '' when that body is too short to overlap."""
+    overlap_len = max(50, int(len(prev_body) * overlap_ratio))
+    overlap_start = len(prev_body) - overlap_len
+    if overlap_start <= 0:
+        return ""
+    return "... " + prev_body[overlap_start:].strip() + "\n\n"
+
+
+def _stream_chunks(doc: dict, file_name: str, doc_label: str, overlap_ratio: float):
+    """Yield finished chunks for one document in a single pass (element → chunk → overlap),
+    without building intermediate element or chunk lists.
+
+    Each chunk except the first is prefixed with the tail of the previous chunk's original
+    body (not its already-overlapped text), so snippets don't cascade."""
+    prev_body = None
+    for i, (page_num, typ, text, section) in enumerate(_iter_elements(doc, file_name)):
+        chunk = _build_chunk(i, page_num, typ, text, section, file_name, doc_label)
+        own_text = chunk["text"]
+        if prev_body is not None and overlap_ratio > 0:
+            chunk["text"] = _overlap_prefix(prev_body, overlap_ratio) + own_text
+        # Strip [Page ...] prefix for the next chunk's overlap segment
+        prev_body = own_text.split("\n\n", 1)[-1]
+        yield chunk
+
+
+def _loads(data: bytes):
+    """Parse a JSON document from raw bytes (no intermediate str decode with orjson)."""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dumps_line(obj) -> bytes:
+    """Serialize one JSONL record to UTF-8 bytes, newline included."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj) + "\n").encode("utf-8")
+
+
+def _pooled_storage_client(pool_size: int):
+    """storage.Client whose HTTP session keeps pool_size keep-alive connections, one per worker.
+    requests' default pool holds 10; extra workers would otherwise re-handshake TLS per download."""
+    client = storage.Client(project=config.PROJECT_ID)
+    client._http.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    return client
+
+
+def _load_document(storage_client, bucket_name: str, stem: str, json_blobs: list):
+    """Download and parse one document's Document AI JSON (json_blobs: its .json blob names).
+    Returns (stem, doc, skip_reason); skip_reason is None on success."""
+    if not json_blobs:
+        return stem, None, "no JSON"
+    # Prefer document.json (sync output), else first .json
+    preferred = [n for n in json_blobs if n.endswith("document.json")]
+    json_blob_name = preferred[0] if preferred else json_blobs[0]
+    blob = storage_client.bucket(bucket_name).blob(json_blob_name)
+    try:
+        return stem, _slim_document(_loads(blob.download_as_bytes())), None
+    except Exception as e:
+        return stem, None, f"failed to load JSON — {e}"
+
+
+def _list_doc_folders(storage_client, bucket_name: str, docai_prefix: str) -> list:
+    """List blobs under docai_prefix once, group .json names by first path segment (doc_stem).
+    Returns sorted [(stem, [json blob names]), ...]."""
+    by_stem = defaultdict(list)
+    for b in storage_client.list_blobs(bucket_name, prefix=docai_prefix):
+        parts = b.name[len(docai_prefix):].split("/", 1)
+        if not parts[0]:
             continue
-        prev_text = out[-1]["text"]
-        # Strip [Page ...] prefix for overlap segment
-        prev_body = prev_text.split("\n\n", 1)[-1] if "\n\n" in prev_text else prev_text
-        overlap_len = max(50, int(len(prev_body) * overlap_ratio))
-        overlap_start = len(prev_body) - overlap_len
-        if overlap_start > 0:
-            overlap_snippet = "... " + prev_body[overlap_start:].strip()
-            new_text = overlap_snippet + "\n\n" + c["text"]
-        else:
-            new_text = c["text"]
-        out.append({**c, "text": new_text})
-    return out
-
-
-def get_doc_ai_blobs(storage_client, bucket_name: str, folder_prefix: str) -> list:
-    """List blob names under folder_prefix that end with .json."""
-    bucket = storage_client.bucket(bucket_name)
-    blobs = list(bucket.list_blobs(prefix=folder_prefix))
-    return [b.name for b in blobs if b.name.endswith(".json")]
+        json_names = by_stem[parts[0]]
+        if len(parts) == 2 and parts[1].endswith(".json"):
+            json_names.append(b.name)
+    return sorted(by_stem.items())
+
+
+def _manifest_cache_path(bucket_name: str, docai_prefix: str) -> str:
+    key = hashlib.sha1(f"{bucket_name}/{docai_prefix}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"docai_manifest_{key}.json")
+
+
+def _read_manifest_cache(path: str):
+    """Cached doc_folders if the cache file exists and is younger than the TTL, else None."""
+    try:
+        if time.time() - os.path.getmtime(path) > MANIFEST_CACHE_TTL_SECONDS:
+            return None
+        with open(path, "rb") as f:
+            return [(stem, names) for stem, names in _loads(f.read())]
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def _write_manifest_cache(path: str, doc_folders: list) -> None:
+    """Best effort; a failed write only means the next run lists GCS again."""
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(_dumps_line(doc_folders))
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def _ordered_map(pool, fn, items, window: int):
+    """Like pool.map, but keeps at most `window` tasks in flight so finished
+    documents don't pile up in memory while the writer catches up."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Phase 2: layout-based chunking of Document AI output.")
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help=f"Reuse the Document AI listing from a run in the last {MANIFEST_CACHE_TTL_SECONDS // 60} min instead of listing GCS again.",
+    )
+    args = parser.parse_args()
+
     print("\n" + "=" * 60)
     print("  PHASE 2: Chunking (Document AI → layout-based chunks)")
     print("=" * 60)
@@ -237,72 +394,77 @@ def main():
     print(f"  Doc AI output: gs://{config.GCS_PDF_INPUT_BUCKET}/{config.DOCAI_OUTPUT_PREFIX}/")
     print(f"  Chunks output: gs://{config.CHUNKS_BUCKET}/{config.CHUNK_OUTPUT_PREFIX}/chunks.jsonl")
 
-    storage_client = storage.Client(project=config.PROJECT_ID)
+    storage_client = _pooled_storage_client(DOC_WORKERS)
     bucket_name = config.GCS_PDF_INPUT_BUCKET
     out_bucket = config.CHUNKS_BUCKET
     docai_prefix = config.DOCAI_OUTPUT_PREFIX.strip().rstrip("/") + "/"
     overlap = getattr(config, "CHUNK_OVERLAP_RATIO", 0.12)
 
     print("\n[Step 1] Listing Document AI output folders...")
-    # List blobs under document-ai-output/, group by first path segment (doc_stem)
-    all_blobs = list(storage_client.list_blobs(bucket_name, prefix=docai_prefix))
-    stems_seen = set()
-    for b in all_blobs:
-        parts = b.name[len(docai_prefix):].split("/")
-        if parts and parts[0]:
-            stems_seen.add(parts[0])
-    doc_folders = sorted(stems_seen)
+    cache_path = _manifest_cache_path(bucket_name, docai_prefix)
+    doc_folders = _read_manifest_cache(cache_path) if args.cache else None
+    if doc_folders:
+        print(f"   Using cached listing ({cache_path}); omit --cache to relist")
+    else:
+        doc_folders = _list_doc_folders(storage_client, bucket_name, docai_prefix)
+        if doc_folders:
+            _write_manifest_cache(cache_path, doc_folders)
     if not doc_folders:
         print(f"   No Document AI output under gs://{bucket_name}/{docai_prefix}")
         print("   Run phase1b_parsing.py first.")
         sys.exit(1)
     print(f"   Found {len(doc_folders)} document(s)")
 
-    print("\n[Step 2] Loading JSON and building layout-based chunks...")
-    all_chunks = []
-    for stem in doc_folders:
-        folder_prefix = docai_prefix + stem + "/"
-        json_blobs = [n for n in get_doc_ai_blobs(storage_client, bucket_name, folder_prefix)]
-        if not json_blobs:
-            print(f"   Skip {stem}: no JSON")
-            continue
-        # Prefer document.json (sync output), else first .json
-        preferred = [n for n in json_blobs if n.endswith("document.json")]
-        json_blob_name = preferred[0] if preferred else json_blobs[0]
-        blob = storage_client.bucket(bucket_name).blob(json_blob_name)
-        try:
-            doc = json.loads(blob.download_as_text())
-        except Exception as e:
-            print(f"   Skip {stem}: failed to load JSON — {e}")
-            continue
-        
-        file_name = stem.replace("_", " ") + ".pdf"
-        elements = _collect_elements(doc, file_name)
-        if not elements:
-            print(f"   Skip {stem}: no elements extracted")
-            continue
-        doc_chunks = _elements_to_chunks(elements, file_name, stem)
-        doc_chunks = _apply_overlap(doc_chunks, overlap)
-        all_chunks.extend(doc_chunks)
-        print(f"   {stem}: {len(elements)} elements → {len(doc_chunks)} chunks")
+    print("\n[Step 2] Loading JSON, building layout-based chunks and streaming them to GCS...")
+    blob_name = f"{config.CHUNK_OUTPUT_PREFIX}/chunks.jsonl"
+    bucket = storage_client.bucket(out_bucket)
+    staging_blob = bucket.blob(blob_name + STAGING_SUFFIX)
+    # Opened on the first produced chunk and written to the staging name: the writer's finalizer
+    # commits a partial upload if the run dies, so only a completed file replaces chunks.jsonl
+    writer = None
+    total_chunks = 0
+    samples = []
+    with ThreadPoolExecutor(max_workers=DOC_WORKERS) as pool:
+        results = _ordered_map(
+            pool,
+            lambda item: _load_document(storage_client, bucket_name, item[0], item[1]),
+            doc_folders,
+            DOC_WORKERS * 2,
+        )
+        for stem, doc, skip_reason in results:
+            if skip_reason:
+                print(f"   Skip {stem}: {skip_reason}")
+                continue
+            file_name = stem.replace("_", " ") + ".pdf"
+            # Serialize the whole document first and hand the writer one block instead of one call per chunk
+            lines = []
+            for c in _stream_chunks(doc, file_name, stem, overlap):
+                lines.append(_dumps_line(c))
+                if len(samples) < 3:
+                    samples.append(c)
+            doc_chunk_count = len(lines)
+            if not doc_chunk_count:
+                print(f"   Skip {stem}: no elements extracted")
+                continue
+            if writer is None:
+                writer = staging_blob.open("wb", content_type="application/jsonl", chunk_size=UPLOAD_CHUNK_SIZE)
+            writer.write(b"".join(lines))
+            total_chunks += doc_chunk_count
+            print(f"   {stem}: {doc_chunk_count} chunks")
 
-    if not all_chunks:
+    if writer is None:
         print("   ERROR: No chunks produced.")
         sys.exit(1)
+    writer.close()
+    bucket.rename_blob(staging_blob, blob_name)
 
-    print(f"\n   Total chunks: {len(all_chunks)}")
+    print(f"\n   Total chunks: {total_chunks}")
     print(f"   Overlap: {int(overlap * 100)}%")
-
-    print("\n[Step 3] Uploading chunks to GCS...")
-    chunks_jsonl = "\n".join(json.dumps(c) for c in all_chunks)
-    blob_name = f"{config.CHUNK_OUTPUT_PREFIX}/chunks.jsonl"
-    out_blob = storage_client.bucket(out_bucket).blob(blob_name)
-    out_blob.upload_from_string(chunks_jsonl, content_type="application/jsonl")
     uri = f"gs://{out_bucket}/{blob_name}"
     print(f"   Uploaded: {uri}")
 
     print("\n[Sample chunks]")
-    for i, c in enumerate(all_chunks[:3]):
+    for i, c in enumerate(samples):
         preview = c["text"][:180].replace("\n", " ")
         print(f"   {i+1}. [{c['metadata']['type']}] {preview}...")
 
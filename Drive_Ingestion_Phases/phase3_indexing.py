@@ -2,26 +2,38 @@
 Phase 3: Indexing (Embedding & Vector Search)
 
 Step 1: Read chunks from GCS (chunks/chunks.jsonl).
-Step 2: Generate embeddings in batches via Vertex AI text-embedding-004 (768-dim).
-Step 3: Upload embedding JSONL to GCS (embeddings/embeddings.json).
+Step 2: Generate embeddings in batches via Vertex AI text-embedding-004 (768-dim),
+        streaming each record to GCS (embeddings/embeddings.json, or embeddings.avro with
+        --format avro) as it is produced.
+Step 3: Finalize the embeddings upload (the object only appears once every chunk is embedded).
 Step 4: Create Vertex AI Vector Search index from that GCS path (async LRO).
 
 By default every run starts from the beginning. To resume after a failure, use
---resume-file with the partial file (written every 500 chunks as embeddings_partial.jsonl).
+--resume-file with the partial file (appended after every batch as embeddings_partial.jsonl).
 Resume is reliable only when chunks.jsonl has not changed.
 
   python phase3_indexing.py
   python phase3_indexing.py --resume-file embeddings_partial.jsonl
+  python phase3_indexing.py --resume-file embeddings_partial.jsonl --verify-resume
+  python phase3_indexing.py --format avro   # binary float32 vectors (needs fastavro)
+  python phase3_indexing.py --concurrency 16   # more embedding requests in flight (quota permitting)
 """
 import argparse
 import json
 import os
+import queue
+import random
 import sys
+import threading
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 import config
 from google.api_core.exceptions import (
     DeadlineExceeded,
+    InvalidArgument,
+    NotFound,
     ResourceExhausted,
     ServiceUnavailable,
 )
@@ -35,76 +47,485 @@ from google.cloud import aiplatform
 from google.cloud.aiplatform import matching_engine
 from google.cloud.aiplatform.matching_engine import matching_engine_index_config as me_config
 
-# text-embedding-004 dimension; smaller batch + delay to stay under quota
+try:
+    import orjson
+except ImportError:  # optional: C parser/serializer; stdlib json works the same, just slower
+    orjson = None
+
+try:
+    import fastavro
+except ImportError:  # optional: only needed for --format avro
+    fastavro = None
+
+try:
+    import numpy as np
+except ImportError:  # optional (installed with google-cloud-aiplatform); without it vectors stay lists
+    np = None
+
+# text-embedding-004 dimension; requests are paced by RateLimiter to stay under quota
 EMBEDDING_DIM = 768
+# Texts per request: starts at BATCH_SIZE, grows by BATCH_SIZE_STEP after each successful call
+# (up to the model's BATCH_SIZE_MAX inputs) and halves on 429 / rejected request (not below BATCH_SIZE_MIN)
 BATCH_SIZE = 20
-SLEEP_BETWEEN_BATCHES = 3.0  # stay under embedding quota (e.g. 60–300 req/min)
-MAX_RETRIES_429 = 5
-BACKOFF_SECONDS = 90
-# Retry on 503/timeouts (connection or server temporarily unavailable)
+BATCH_SIZE_MIN = 5
+BATCH_SIZE_MAX = 250
+BATCH_SIZE_STEP = 10
+# A request is also cut short at this many estimated tokens (~4 chars each); the API rejects larger ones
+MAX_TOKENS_PER_REQUEST = 20000
+# Embedding requests in flight (default for --concurrency, overridable via config.EMBED_CONCURRENCY);
+# results are still consumed (and checkpointed) in chunk order
+EMBED_WORKERS = 5
+# Retries per batch on 429 (quota); each backs off every worker through the shared limiter
+MAX_RETRIES_429 = 10
+# Distinct texts whose vectors are remembered across batches (repeated headers/footers/boilerplate)
+EMBED_CACHE_MAX_ENTRIES = 10000
+# Exponential backoff on quota/transient errors: 2, 4, 8, ... seconds, capped. With 10 retries
+# a batch keeps trying for about 6 minutes before the run gives up.
+BACKOFF_MAX_SECONDS = 60
+# Each backoff is stretched by a random 0..25% so workers that failed together do not retry in lockstep
+BACKOFF_JITTER = 0.25
+# After a 429 the shared pacing interval doubles (up to this factor) for every worker, and halves
+# again after RATE_RECOVERY_SUCCESSES requests in a row succeed
+RATE_SLOWDOWN_MAX = 8
+RATE_RECOVERY_SUCCESSES = 10
+# Retry on 429 and 503/timeouts (connection or server temporarily unavailable); the latter
+# count against MAX_RETRIES_TRANSIENT
 TRANSIENT_EXCEPTIONS = (ResourceExhausted, ServiceUnavailable, DeadlineExceeded)
-MAX_RETRIES_TRANSIENT = 5
-# Checkpoint progress every N batches so we can resume after timeout/503
+MAX_RETRIES_TRANSIENT = 10
+# Streaming read buffer for chunks.jsonl (few large ranged GETs instead of one whole-file string)
+GCS_READ_CHUNK_SIZE = 16 * 1024 * 1024
+# Resumable upload chunk for the streamed embeddings.json (must be a multiple of 256 KiB)
+GCS_UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+# Index input written under EMBEDDINGS_GCS_PREFIX per --format: name, content type.
+# Vector Search reads every file under the prefix, so the other format's file is removed on success.
+EMBEDDINGS_OUTPUTS = {
+    "json": ("embeddings.json", "application/jsonl"),
+    "avro": ("embeddings.avro", "application/octet-stream"),
+}
+# Suffix for the sibling prefix the output is streamed to before being renamed into place.
+# Kept outside EMBEDDINGS_GCS_PREFIX so an index build never picks up an in-progress file.
+EMBEDDINGS_STAGING_SUFFIX = ".partial"
+# Token restrict on every record; phase 4 queries filter on source=doc-pipeline
+RESTRICTS = [{"namespace": "source", "allow": ["doc-pipeline"]}]
+# Vector Search Avro input schema (id, float32 embedding, token restricts)
+AVRO_SCHEMA = {
+    "type": "record",
+    "name": "FeatureVector",
+    "fields": [
+        {"name": "id", "type": "string"},
+        {"name": "embedding", "type": {"type": "array", "items": "float"}},
+        {
+            "name": "restricts",
+            "type": {
+                "type": "array",
+                "items": {
+                    "type": "record",
+                    "name": "Restrict",
+                    "fields": [
+                        {"name": "namespace", "type": "string"},
+                        {"name": "allow", "type": {"type": "array", "items": "string"}, "default": []},
+                        {"name": "deny", "type": {"type": "array", "items": "string"}, "default": []},
+                    ],
+                },
+            },
+            "default": [],
+        },
+    ],
+}
+# Avro block size before a block is flushed to the GCS writer
+AVRO_SYNC_INTERVAL = 1024 * 1024
+# Embedded batches waiting for the upload thread (each <= BATCH_SIZE_MAX records); bounds memory if GCS is slow
+UPLOAD_QUEUE_BATCHES = 8
+# Every embedded batch is appended (and fsynced) here so we can resume after timeout/503.
+# The cursor sidecar records how far the checkpoint got; it is replaced atomically after each append.
 CHECKPOINT_FILE = "embeddings_partial.jsonl"
-CHECKPOINT_INTERVAL_BATCHES = 25  # save every 500 chunks so we lose at most 500 on crash
+CHECKPOINT_CURSOR_FILE = "embeddings_partial.cursor"
+# Chunks the API rejects outright (InvalidArgument, isolated by halving the batch) are listed here
+# and left out of the index; the checkpoint keeps a {"id", "skipped"} line for them so positions hold.
+SKIPPED_FILE = "embeddings_skipped.jsonl"
+# "Embedded x/y" progress is printed at most this often (and once at the end), not per batch
+PROGRESS_INTERVAL_SECONDS = 5
+
+
+def _loads(data: bytes):
+    """Parse one JSON record from raw bytes (no intermediate str decode with orjson)."""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dumps(obj) -> bytes:
+    """Serialize one JSONL record to UTF-8 bytes (no trailing newline). Embedding vectors may be
+    numpy float32 rows: orjson writes them natively, stdlib json via tolist()."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_ndarray_to_list).encode("utf-8")
+
+
+def _ndarray_to_list(obj):
+    if np is not None and isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# Constant end of every embeddings JSONL line, serialized once
+_RECORD_TAIL = b',"restricts":' + _dumps(RESTRICTS) + b"}\n"
+
+
+def _record_line(chunk_id, vec) -> bytes:
+    """One embeddings JSONL line, newline included; same bytes as _dumps of the record dict
+    (with orjson), but only the id and the vector are serialized per record."""
+    return b'{"id":' + _dumps(chunk_id) + b',"embedding":' + _dumps(vec) + _RECORD_TAIL
+
+
+def _iter_jsonl(blob):
+    """Stream a JSONL blob, yielding parsed records. Lines are split out of GCS_READ_CHUNK_SIZE
+    blocks: BlobReader has no peek(), so iterating it line by line reads one byte per call."""
+    tail = b""
+    with blob.open("rb", chunk_size=GCS_READ_CHUNK_SIZE) as f:
+        while True:
+            block = f.read(GCS_READ_CHUNK_SIZE)
+            if not block:
+                break
+            lines = (tail + block).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                if line:
+                    yield _loads(line)
+    if tail:
+        yield _loads(tail)
 
 
 def download_chunks(storage_client, bucket_name, chunks_path):
-    """Download chunks JSONL from GCS; return list of chunk dicts."""
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(chunks_path)
-    if not blob.exists():
-        return []
-    data = blob.download_as_text()
-    chunks = []
-    for line in data.strip().split("\n"):
-        if not line:
-            continue
-        chunks.append(json.loads(line))
-    return chunks
+    """Download chunks JSONL from GCS; return (list of {"id", "text"} dicts, content fingerprint).
+    Only the fields embedding needs are kept while streaming, so per-chunk metadata is never held
+    for the whole run. The fingerprint is the object's server-side MD5 (CRC32C for composite
+    objects): it pins the exact chunks.jsonl a checkpoint was built from, at no extra cost
+    (get_blob replaces exists())."""
+    blob = storage_client.bucket(bucket_name).get_blob(chunks_path)
+    if blob is None:
+        return [], None
+    chunks = [{"id": c["id"], "text": c["text"]} for c in _iter_jsonl(blob)]
+    return chunks, blob.md5_hash or blob.crc32c
+
+
+class RateLimiter:
+    """Proactive pacing for the embedding quota, shared by all workers.
+    Each acquire() reserves the next send slot, spaced by whichever budget (requests or
+    estimated tokens per minute) is tighter, and sleeps only until that slot.
+    A 429 (on_throttle) holds every worker off for the backoff and slows the spacing;
+    runs of successes (on_success) bring it back to the configured rate."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._slowdown = 1
+        self._successes = 0
+
+    def acquire(self, est_tokens: int = 0) -> None:
+        interval = 60.0 / self.requests_per_minute if self.requests_per_minute > 0 else 0.0
+        if self.tokens_per_minute > 0:
+            interval = max(interval, 60.0 * est_tokens / self.tokens_per_minute)
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + interval * self._slowdown
+        if slot > now:
+            time.sleep(slot - now)
+
+    def on_throttle(self, wait: float) -> None:
+        with self._lock:
+            self._slowdown = min(RATE_SLOWDOWN_MAX, self._slowdown * 2)
+            self._successes = 0
+            self._next_slot = max(self._next_slot, time.monotonic() + wait)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self._successes += 1
+            if self._slowdown > 1 and self._successes >= RATE_RECOVERY_SUCCESSES:
+                self._slowdown //= 2
+                self._successes = 0
+
+
+class BatchSizer:
+    """AIMD batch size shared by all workers: +step after a successful request, halved after a
+    429 or a rejected (InvalidArgument) multi-text request."""
+
+    def __init__(self, initial: int, minimum: int, maximum: int, step: int):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self._lock = threading.Lock()
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.size = min(self.maximum, self.size + self.step)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            self.size = max(self.minimum, self.size // 2)
+
+
+def _batch_spans(chunks, start: int, sizer):
+    """Yield (i, j) slices of chunks from start, each at most sizer.size chunks (read as each
+    batch is cut) and MAX_TOKENS_PER_REQUEST estimated tokens; never empty."""
+    i = start
+    while i < len(chunks):
+        limit = min(len(chunks), i + sizer.size)
+        j = i + 1
+        tokens = len(chunks[i]["text"]) // 4
+        while j < limit:
+            tokens += len(chunks[j]["text"]) // 4
+            if tokens > MAX_TOKENS_PER_REQUEST:
+                break
+            j += 1
+        yield i, j
+        i = j
+
+
+class EmbeddingCache:
+    """Thread-safe LRU of text -> embedding, bounded to max_entries."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, text):
+        with self._lock:
+            vec = self._entries.get(text)
+            if vec is not None:
+                self._entries.move_to_end(text)
+            return vec
+
+    def put_many(self, items) -> None:
+        with self._lock:
+            for text, vec in items:
+                self._entries[text] = vec
+                self._entries.move_to_end(text)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class BackgroundUploader:
+    """Runs emit(*item) for queued items on its own thread, so a resumable-upload chunk that
+    blocks in writer.write() does not stall the embedding loop. The first error is re-raised
+    to the producer on the next put() or on close()."""
+
+    def __init__(self, emit, maxsize: int):
+        self._emit = emit
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="embeddings-upload", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is None:
+                try:
+                    self._emit(*item)
+                except BaseException as e:
+                    self._error = e
+
+    def put(self, *item) -> None:
+        if self._error is not None:
+            raise self._error
+        self._queue.put(item)
+
+    def close(self) -> None:
+        """Wait until everything queued has been written."""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+def load_embedding_model():
+    """vertexai.init + TextEmbeddingModel.from_pretrained (auth and model metadata RPCs)."""
+    vertexai.init(project=config.PROJECT_ID, location=config.LOCATION)
+    return TextEmbeddingModel.from_pretrained(config.EMBEDDING_MODEL)
 
 
 def embed_batch(model, texts):
-    """Return list of embedding vectors (each a list of floats) for the given texts."""
+    """Return list of embedding vectors for the given texts: float32 rows of one (n, 768) array
+    when numpy is available (4 bytes per value instead of a boxed Python float), else lists."""
     if not texts:
         return []
     embeddings = model.get_embeddings(texts)
-    return [list(e.values) for e in embeddings]
-
-
-def embed_batch_with_retry(model, texts):
-    """Call embed_batch; retry on 429 (quota), 503 (unavailable), timeouts (DeadlineExceeded)."""
-    for attempt in range(MAX_RETRIES_TRANSIENT + 1):
+    if np is not None:
+        return list(np.asarray([e.values for e in embeddings], dtype=np.float32))
+    # TextEmbedding.values is already a plain list of floats; no need to copy it
+    return [e.values for e in embeddings]
+
+
+def embed_batch_with_retry(model, texts, limiter=None, sizer=None):
+    """Call embed_batch; retry on 429 (quota), 503 (unavailable), timeouts (DeadlineExceeded).
+    With a limiter, every attempt (retries included) waits for its quota slot first, and a 429
+    backs off all workers through it; with a sizer, successes and 429s adjust the size of
+    batches cut afterwards."""
+    est_tokens = sum(len(t) for t in texts) // 4
+    retries = {True: 0, False: 0}  # throttled -> retries so far of that kind
+    while True:
+        if limiter is not None:
+            limiter.acquire(est_tokens)
         try:
-            return embed_batch(model, texts)
+            embs = embed_batch(model, texts)
         except TRANSIENT_EXCEPTIONS as e:
-            if attempt < MAX_RETRIES_TRANSIENT:
-                kind = "Quota exceeded" if type(e).__name__ == "ResourceExhausted" else "Connection/timeout or server unavailable"
-                print(f"   {kind}, waiting {BACKOFF_SECONDS}s before retry ({attempt + 1}/{MAX_RETRIES_TRANSIENT})...")
-                time.sleep(BACKOFF_SECONDS)
-            else:
+            throttled = isinstance(e, ResourceExhausted)
+            if sizer is not None and throttled:
+                sizer.on_throttle()
+            max_retries = MAX_RETRIES_429 if throttled else MAX_RETRIES_TRANSIENT
+            attempt = retries[throttled]
+            if attempt >= max_retries:
                 raise
+            retries[throttled] = attempt + 1
+            wait = min(BACKOFF_MAX_SECONDS, 2 ** (attempt + 1)) * (1 + BACKOFF_JITTER * random.random())
+            kind = "Quota exceeded" if throttled else "Connection/timeout or server unavailable"
+            print(f"   {kind}, waiting {wait:.1f}s before retry ({attempt + 1}/{max_retries})...")
+            if limiter is not None and throttled:
+                # The limiter now holds every worker off for `wait`; the next acquire() sleeps it
+                limiter.on_throttle(wait)
+            else:
+                time.sleep(wait)
+        else:
+            if sizer is not None:
+                sizer.on_success()
+            if limiter is not None:
+                limiter.on_success()
+            return embs
+
+
+def _ordered_map(pool, fn, items, window: int):
+    """Like pool.map, but keeps at most `window` tasks in flight (results in input order)."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _write_cursor(path, next_index, last_id, chunks_fingerprint):
+    """Atomically record checkpoint progress (tmp file + os.replace)."""
+    tmp = path + ".tmp"
+    cursor = {"next_index": next_index, "last_id": last_id, "chunks_md5": chunks_fingerprint, "mtime": time.time()}
+    with open(tmp, "wb") as f:
+        f.write(_dumps(cursor))
+    os.replace(tmp, path)
+
+
+def _read_cursor(path):
+    try:
+        with open(path, "rb") as f:
+            return _loads(f.read())
+    except (OSError, ValueError):
+        return None
 
 
-def load_resume_file(path, chunks):
+def embed_isolating_bad_inputs(model, texts, limiter=None, sizer=None):
+    """embed_batch_with_retry, but a non-transient InvalidArgument splits the batch in half
+    (recursively) until the offending text is alone. Its vector is None; the rest still embed,
+    so one bad chunk costs O(log batch) extra requests instead of the run."""
+    try:
+        return embed_batch_with_retry(model, texts, limiter, sizer)
+    except InvalidArgument as e:
+        if len(texts) == 1:
+            print(f"   Skipping a chunk the embedding API rejected ({len(texts[0])} chars): {e}")
+            return [None]
+        if sizer is not None:
+            sizer.on_throttle()
+        mid = len(texts) // 2
+        return (
+            embed_isolating_bad_inputs(model, texts[:mid], limiter, sizer)
+            + embed_isolating_bad_inputs(model, texts[mid:], limiter, sizer)
+        )
+
+
+def embed_unique(model, texts, limiter=None, cache=None, sizer=None):
+    """Embed texts, sending each distinct text once: duplicates within the batch share one
+    request slot, and texts already in cache (earlier batches) are not sent at all.
+    Returns one vector per input text, in order (None for a text the API rejected)."""
+    known = {}
+    todo = []
+    for t in texts:
+        if t in known:
+            continue
+        vec = cache.get(t) if cache is not None else None
+        if vec is not None:
+            known[t] = vec
+        else:
+            known[t] = None
+            todo.append(t)
+    if todo:
+        fresh = list(zip(todo, embed_isolating_bad_inputs(model, todo, limiter, sizer)))
+        known.update(fresh)
+        if cache is not None:
+            cache.put_many((t, vec) for t, vec in fresh if vec is not None)
+    return [known[t] for t in texts]
+
+
+def _is_skip_marker(line: bytes) -> bool:
+    """Checkpoint line for a skipped chunk ({"id": ..., "skipped": true}); vector records end in ]}."""
+    return line.endswith(b"true}") and b'"skipped"' in line
+
+
+def _record_id(line: bytes):
+    """The "id" of one embeddings record without parsing its 768-float vector. Records written
+    by this script start with {"id":"<id>" (or {"id": "<id>" from stdlib json); anything else,
+    or an id containing escapes, falls back to a full parse."""
+    if line.startswith(b'{"id":'):
+        start = 6 + (line[6:7] == b" ")
+        if line[start : start + 1] == b'"':
+            end = line.find(b'"', start + 1)
+            if end != -1 and b"\\" not in line[start + 1 : end]:
+                return line[start + 1 : end].decode("utf-8")
+    return _loads(line).get("id")
+
+
+def load_resume_file(path, chunks, verify=False, chunks_fingerprint=None):
     """
     Load a partial embeddings JSONL and verify it matches the first N chunks.
-    Returns (lines, start_index). Exits with error if IDs don't align.
+    Returns (lines as bytes, start_index). Exits with error if IDs don't align.
+    A torn last line (crash mid-append) is dropped. If the cursor sidecar pins a different
+    chunks.jsonl fingerprint, fail fast. When the cursor agrees with the file (same count,
+    same last id as chunks[n-1]) the per-line id scan is skipped unless verify.
     """
-    with open(path, "r", encoding="utf-8") as f:
-        lines = [line.rstrip("\n") for line in f if line.strip()]
+    with open(path, "rb") as f:
+        raw = f.readlines()
+    if raw and not raw[-1].endswith(b"\n"):
+        raw.pop()
+    lines = [line.rstrip(b"\n") for line in raw if line.strip()]
     if not lines:
         return [], 0
     n = len(lines)
     if n > len(chunks):
         print(f"   ERROR: Resume file has {n} lines but chunks only has {len(chunks)}. Wrong file or chunks changed.")
         sys.exit(1)
+    cursor = _read_cursor(os.path.splitext(path)[0] + ".cursor")
+    if not isinstance(cursor, dict):
+        cursor = {}
+    pinned = cursor.get("chunks_md5")
+    if pinned and chunks_fingerprint and pinned != chunks_fingerprint:
+        print("   ERROR: Resume file was built from a different chunks.jsonl (content hash changed). Do not use an old checkpoint after re-running Phase 2.")
+        sys.exit(1)
+    if (
+        not verify
+        and cursor.get("next_index") == n
+        and cursor.get("last_id") == chunks[n - 1]["id"]
+    ):
+        return lines, n
     # Ensure each line's "id" matches the corresponding chunk (reliable resume)
     for j, line in enumerate(lines):
         try:
-            rec = json.loads(line)
-            rid = rec.get("id")
-        except (json.JSONDecodeError, TypeError):
+            rid = _record_id(line)
+        except (ValueError, TypeError, AttributeError):
             print(f"   ERROR: Resume file line {j + 1} is not valid JSON with 'id'.")
             sys.exit(1)
         if rid != chunks[j]["id"]:
@@ -116,7 +537,19 @@ def load_resume_file(path, chunks):
 def main():
     parser = argparse.ArgumentParser(description="Phase 3: Embed chunks and create Vector Search index. Use --resume-file to resume from a partial JSONL.")
     parser.add_argument("--resume-file", type=str, default=None, help="Path to partial embeddings JSONL (same format as output). Script will only embed the remaining chunks. Reliable only if chunks.jsonl has not changed.")
+    parser.add_argument("--verify-resume", action="store_true", help="Check every resumed line's id against chunks.jsonl even when the checkpoint cursor matches.")
+    parser.add_argument("--format", choices=sorted(EMBEDDINGS_OUTPUTS), default="json", help="Index input format: json (JSONL, default, easy to inspect) or avro (binary float32, ~2-3x smaller; needs fastavro). The local checkpoint is always JSONL.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=getattr(config, "EMBED_CONCURRENCY", EMBED_WORKERS),
+        help=f"Embedding requests in flight (default config.EMBED_CONCURRENCY or {EMBED_WORKERS}). Pacing still follows EMBED_REQUESTS_PER_MINUTE.",
+    )
     args = parser.parse_args()
+    workers = max(1, args.concurrency)
+    if args.format == "avro" and fastavro is None:
+        print("   ERROR: --format avro needs fastavro (pip install fastavro).")
+        sys.exit(1)
 
     print("\n" + "=" * 60)
     print("  PHASE 3: Indexing (Embeddings → Vector Search)")
@@ -129,6 +562,10 @@ def main():
     embeddings_prefix = getattr(config, "EMBEDDINGS_GCS_PREFIX", "embeddings")
 
     storage_client = storage.Client(project=config.PROJECT_ID)
+    # Load the embedding model in the background; it is independent of the chunks download
+    init_pool = ThreadPoolExecutor(max_workers=1)
+    model_future = init_pool.submit(load_embedding_model)
+    init_pool.shutdown(wait=False)
 
     # Use same bucket as Phase 2 chunks (CHUNKS_BUCKET = pdf-input bucket by default)
     bucket = getattr(config, "CHUNKS_BUCKET", config.GCS_PDF_INPUT_BUCKET)
@@ -137,7 +574,7 @@ def main():
     print(f"\n  Chunks: gs://{bucket}/{chunks_path}")
     print(f"  Embeddings output: gs://{bucket}/{embeddings_prefix}/")
     print("\n[Step 1] Reading chunks from GCS...")
-    chunks = download_chunks(storage_client, bucket, chunks_path)
+    chunks, chunks_fingerprint = download_chunks(storage_client, bucket, chunks_path)
     if not chunks:
         print(f"   No chunks at gs://{bucket}/{chunks_path}. Run Phase 2 first.")
         sys.exit(1)
@@ -150,54 +587,131 @@ def main():
         if not os.path.exists(args.resume_file):
             print(f"   ERROR: --resume-file not found: {args.resume_file}")
             sys.exit(1)
-        vectors_jsonl_lines, start_index = load_resume_file(args.resume_file, chunks)
+        vectors_jsonl_lines, start_index = load_resume_file(
+            args.resume_file, chunks, verify=args.verify_resume, chunks_fingerprint=chunks_fingerprint
+        )
         print(f"   Resuming from --resume-file: {start_index} embeddings already done (validated against chunks).")
 
-    print("\n[Step 2] Generating embeddings (text-embedding-004)...")
-    vertexai.init(project=config.PROJECT_ID, location=config.LOCATION)
-    model = TextEmbeddingModel.from_pretrained(config.EMBEDDING_MODEL)
-
-    for i in range(start_index, len(chunks), BATCH_SIZE):
-        batch = chunks[i : i + BATCH_SIZE]
-        texts = [c["text"] for c in batch]
-        ids = [c["id"] for c in batch]
-        embs = embed_batch_with_retry(model, texts)
-        for chunk_id, vec in zip(ids, embs):
-            record = {
-                "id": chunk_id,
-                "embedding": vec,
-                "restricts": [{"namespace": "source", "allow": ["doc-pipeline"]}],
-            }
-            vectors_jsonl_lines.append(json.dumps(record))
-        print(f"   Embedded {min(i + BATCH_SIZE, len(chunks))}/{len(chunks)}")
-        time.sleep(SLEEP_BETWEEN_BATCHES)
-        # Checkpoint periodically so we can resume if the run fails later
-        batch_num = (i - start_index) // BATCH_SIZE + 1
-        if batch_num % CHECKPOINT_INTERVAL_BATCHES == 0:
-            with open(CHECKPOINT_FILE, "w", encoding="utf-8") as f:
-                f.write("\n".join(vectors_jsonl_lines) + "\n")
-            print(f"   Checkpoint saved ({len(vectors_jsonl_lines)} embeddings).")
-
-    if len(vectors_jsonl_lines) != len(chunks):
+    print(f"\n[Step 2] Generating embeddings (text-embedding-004, {workers} request(s) in flight) and streaming them to GCS...")
+    out_name, content_type = EMBEDDINGS_OUTPUTS[args.format]
+    out_bucket = storage_client.bucket(bucket)
+    # Stream to a staging object and rename it into place only after close() succeeds. The
+    # writer's finalizer commits whatever was buffered if the run dies, so writing the real
+    # name directly could replace the previous output with a truncated one.
+    staging_blob = out_bucket.blob(f"{embeddings_prefix}{EMBEDDINGS_STAGING_SUFFIX}/{out_name}")
+    writer = staging_blob.open("wb", content_type=content_type, chunk_size=GCS_UPLOAD_CHUNK_SIZE)
+    avro_out = None
+    if args.format == "avro":
+        avro_out = fastavro.write.Writer(writer, fastavro.parse_schema(AVRO_SCHEMA), sync_interval=AVRO_SYNC_INTERVAL)
+    skipped_ids = [_record_id(line) for line in vectors_jsonl_lines if _is_skip_marker(line)]
+    resumed = b"".join(line + b"\n" for line in vectors_jsonl_lines)
+    if avro_out is None:
+        writer.write(resumed if not skipped_ids else b"".join(
+            line + b"\n" for line in vectors_jsonl_lines if not _is_skip_marker(line)
+        ))
+    else:
+        for line in vectors_jsonl_lines:
+            if not _is_skip_marker(line):
+                avro_out.write(_loads(line))
+    # Checkpoint starts as the resumed lines (if any), swapped in atomically since --resume-file
+    # may be the checkpoint itself; each batch is then appended to it
+    tmp = CHECKPOINT_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(resumed)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, CHECKPOINT_FILE)
+    checkpoint = open(CHECKPOINT_FILE, "ab")
+    n_vectors = start_index
+    _write_cursor(
+        CHECKPOINT_CURSOR_FILE, n_vectors, chunks[n_vectors - 1]["id"] if n_vectors else None, chunks_fingerprint
+    )
+    del vectors_jsonl_lines, resumed
+    model = model_future.result()
+
+    limiter = RateLimiter(
+        getattr(config, "EMBED_REQUESTS_PER_MINUTE", 60),
+        getattr(config, "EMBED_TOKENS_PER_MINUTE", 300000),
+    )
+
+    cache = EmbeddingCache(EMBED_CACHE_MAX_ENTRIES)
+    sizer = BatchSizer(BATCH_SIZE, BATCH_SIZE_MIN, BATCH_SIZE_MAX, BATCH_SIZE_STEP)
+
+    def embed_at(span):
+        i, j = span
+        return i, j, embed_unique(model, [c["text"] for c in chunks[i:j]], limiter, cache, sizer)
+
+    if avro_out is None:
+        def emit(block, records):
+            writer.write(block)
+    else:
+        def emit(block, records):
+            for r in records:
+                avro_out.write(r)
+    # GCS writes happen on the uploader thread, overlapping the embedding requests
+    uploader = BackgroundUploader(emit, UPLOAD_QUEUE_BATCHES)
+
+    # `workers` requests overlap their round-trips; _ordered_map hands batches back in order,
+    # so the output (and the checkpoint) is always a prefix of chunks
+    last_progress = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batches = _ordered_map(pool, embed_at, _batch_spans(chunks, start_index, sizer), workers * 2)
+        with checkpoint:
+            for i, j, embs in batches:
+                ids = [c["id"] for c in chunks[i:j]]
+                records, out_lines, ck_lines = [], [], []
+                for chunk_id, vec in zip(ids, embs):
+                    if vec is None:
+                        ck_lines.append(_dumps({"id": chunk_id, "skipped": True}) + b"\n")
+                        skipped_ids.append(chunk_id)
+                        continue
+                    line = _record_line(chunk_id, vec)
+                    out_lines.append(line)
+                    ck_lines.append(line)
+                    if avro_out is not None:
+                        records.append({"id": chunk_id, "embedding": vec, "restricts": RESTRICTS})
+                uploader.put(b"".join(out_lines), records)
+                # Append only the new batch and make it durable before advancing the cursor
+                checkpoint.write(b"".join(ck_lines))
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+                n_vectors += len(embs)
+                _write_cursor(CHECKPOINT_CURSOR_FILE, n_vectors, ids[len(embs) - 1], chunks_fingerprint)
+                now = time.monotonic()
+                if now - last_progress >= PROGRESS_INTERVAL_SECONDS or j == len(chunks):
+                    last_progress = now
+                    print(f"   Embedded {j}/{len(chunks)} (batch size {sizer.size})")
+
+    if n_vectors != len(chunks):
         print("   WARNING: embedding count does not match chunk count.")
-    print(f"   Total vectors: {len(vectors_jsonl_lines)}")
+    print(f"   Total vectors: {n_vectors - len(skipped_ids)}")
+    if skipped_ids:
+        with open(SKIPPED_FILE, "wb") as f:
+            f.write(b"".join(_dumps({"id": cid}) + b"\n" for cid in skipped_ids))
+        print(f"   WARNING: {len(skipped_ids)} chunk(s) rejected by the embedding API and left out; ids in {SKIPPED_FILE}")
+
+    print("\n[Step 3] Finalizing embeddings upload to GCS...")
+    uploader.close()
+    if avro_out is not None:
+        avro_out.flush()
+    writer.close()
+    out_bucket.rename_blob(staging_blob, f"{embeddings_prefix}/{out_name}")
+    # Drop the other format's file so the index is not built from both
+    for other_name, _ in EMBEDDINGS_OUTPUTS.values():
+        if other_name != out_name:
+            try:
+                out_bucket.blob(f"{embeddings_prefix}/{other_name}").delete()
+            except NotFound:
+                pass
 
     # Remove checkpoint on success so next run starts fresh
-    if os.path.exists(CHECKPOINT_FILE):
-        try:
-            os.remove(CHECKPOINT_FILE)
-        except OSError:
-            pass
-
-    print("\n[Step 3] Uploading embeddings to GCS...")
-    embeddings_jsonl = "\n".join(vectors_jsonl_lines)
-    blob_name = f"{embeddings_prefix}/embeddings.json"
-    bucket_obj = storage_client.bucket(bucket)
-    out_blob = bucket_obj.blob(blob_name)
-    out_blob.upload_from_string(
-        embeddings_jsonl,
-        content_type="application/jsonl",
-    )
+    for path in (CHECKPOINT_FILE, CHECKPOINT_CURSOR_FILE):
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
     contents_uri = f"gs://{bucket}/{embeddings_prefix}/"
     print(f"   Uploaded to {contents_uri}")
 
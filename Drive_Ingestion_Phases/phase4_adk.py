@@ -13,6 +13,11 @@ import asyncio
 import json
 import sys
 
+try:
+    import orjson
+except ImportError:  # optional: C parser; stdlib json works the same, just slower
+    orjson = None
+
 import config
 from google.api_core.exceptions import NotFound
 from google.cloud import storage
@@ -43,14 +48,18 @@ def _load_chunks():
     chunks_bucket = getattr(config, "CHUNKS_BUCKET", config.GCS_BUCKET_NAME)
     bucket = storage.Client(project=config.PROJECT_ID).bucket(chunks_bucket)
     blob = bucket.blob(f"{config.CHUNK_OUTPUT_PREFIX}/chunks.jsonl")
-    if not blob.exists():
+    # No exists() probe: a missing blob costs the same one request either way
+    try:
+        data = blob.download_as_bytes()
+    except NotFound:
         return {}
-    data = blob.download_as_text()
+    # Parse straight from bytes: orjson skips the UTF-8 decode into one big str
+    loads = orjson.loads if orjson else json.loads
     _chunk_cache = {}
-    for line in data.strip().split("\n"):
-        if not line:
+    for line in data.splitlines():
+        if not line.strip():
             continue
-        obj = json.loads(line)
+        obj = loads(line)
         _chunk_cache[obj["id"]] = obj.get("text", "")
     return _chunk_cache
 
@@ -68,8 +77,15 @@ def _get_endpoint():
     global _endpoint
     if _endpoint is None:
         aiplatform.init(project=config.PROJECT_ID, location=config.LOCATION)
-        endpoints = list(matching_engine.MatchingEngineIndexEndpoint.list())
         target = (config.INDEX_ENDPOINT_DISPLAY_NAME or "").strip()
+        # Exact match filtered server-side (one small list call instead of every endpoint in the region).
+        # Re-open by resource name: the constructor sets up the public match client used by find_neighbors.
+        exact = matching_engine.MatchingEngineIndexEndpoint.list(filter=f'display_name="{target}"')
+        if exact:
+            _endpoint = MatchingEngineIndexEndpoint(exact[0].resource_name)
+            return _endpoint
+        # Fall back to listing everything for a case-insensitive match / the error message
+        endpoints = list(matching_engine.MatchingEngineIndexEndpoint.list())
         resource_name = None
         for ep in endpoints:
             name = getattr(getattr(ep, "_gca_resource", None), "display_name", None) or ""
@@ -9,27 +9,28 @@ After this, the deployed index can be queried for Phase 4 (ADK) retrieval.
 """
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import config
 from google.api_core.exceptions import AlreadyExists, FailedPrecondition
 from google.cloud import aiplatform
 from google.cloud.aiplatform import matching_engine
 
-# After undeploy, backend may need time to free the deployed_index_id slot.
-WAIT_AFTER_UNDEPLOY_SECONDS = 120
-# Retry deploy this many times if still "being undeployed".
-DEPLOY_RETRIES = 5
-DEPLOY_RETRY_WAIT_SECONDS = 60
+# Retry deploy while the deployed_index_id slot is still "being undeployed", backing off
+# 2, 4, 8, 16, 30, 30, ... s (about 4 minutes in total).
+DEPLOY_RETRIES = 12
+DEPLOY_RETRY_MAX_WAIT_SECONDS = 30
 
 
 def get_or_create_endpoint():
     """Return an existing endpoint with our display name, or create a new one (public)."""
     aiplatform.init(project=config.PROJECT_ID, location=config.LOCATION)
-    endpoints = list(matching_engine.MatchingEngineIndexEndpoint.list())
-    for ep in endpoints:
-        name = getattr(getattr(ep, "_gca_resource", None), "display_name", None)
-        if name == config.INDEX_ENDPOINT_DISPLAY_NAME:
-            return ep
+    # Filter server-side: one list call returning only our endpoint, not every endpoint in the region
+    endpoints = matching_engine.MatchingEngineIndexEndpoint.list(
+        filter=f'display_name="{config.INDEX_ENDPOINT_DISPLAY_NAME}"'
+    )
+    if endpoints:
+        return endpoints[0]
     print("   Creating new index endpoint (public)...")
     return matching_engine.MatchingEngineIndexEndpoint.create(
         display_name=config.INDEX_ENDPOINT_DISPLAY_NAME,
@@ -46,12 +47,17 @@ def main():
 
     aiplatform.init(project=config.PROJECT_ID, location=config.LOCATION)
 
+    # The index lookup (a GET on the index resource) is independent of the endpoint lookup: overlap them
+    lookup_pool = ThreadPoolExecutor(max_workers=1)
+    index_future = lookup_pool.submit(matching_engine.MatchingEngineIndex, config.VECTOR_INDEX_ID)
+    lookup_pool.shutdown(wait=False)
+
     print("\n[Step 1] Get or create index endpoint...")
     endpoint = get_or_create_endpoint()
     print(f"   Endpoint: {endpoint.resource_name}")
 
     print("\n[Step 2] Deploy index to endpoint...")
-    index = matching_engine.MatchingEngineIndex(config.VECTOR_INDEX_ID)
+    index = index_future.result()
 
     def do_deploy():
         endpoint.deploy_index(
@@ -63,6 +69,7 @@ def main():
 
     def retry_deploy_loop():
         """Retry deploy up to DEPLOY_RETRIES on FailedPrecondition (slot busy/being undeployed)."""
+        wait = 2
         for attempt in range(DEPLOY_RETRIES):
             try:
                 if attempt > 0:
@@ -72,8 +79,9 @@ def main():
             except FailedPrecondition as e:
                 if "retry again later" in str(e).lower() or "being undeployed" in str(e).lower():
                     if attempt < DEPLOY_RETRIES - 1:
-                        print(f"   Slot not ready yet, waiting {DEPLOY_RETRY_WAIT_SECONDS}s before retry...")
-                        time.sleep(DEPLOY_RETRY_WAIT_SECONDS)
+                        print(f"   Slot not ready yet, waiting {wait}s before retry...")
+                        time.sleep(wait)
+                        wait = min(wait * 2, DEPLOY_RETRY_MAX_WAIT_SECONDS)
                     else:
                         raise
                 else:
@@ -83,9 +91,10 @@ def main():
         do_deploy()
     except AlreadyExists:
         print(f"   Existing deployment '{config.DEPLOYED_INDEX_ID}' found. Undeploying (may take a few minutes)...")
+        # undeploy_index waits for its LRO; if the backend has not freed the slot yet, the
+        # deploy fails with FailedPrecondition and retry_deploy_loop backs off and tries again
         endpoint.undeploy_index(deployed_index_id=config.DEPLOYED_INDEX_ID)
-        print("   Undeployed. Waiting for backend to free the slot...")
-        time.sleep(WAIT_AFTER_UNDEPLOY_SECONDS)
+        print("   Undeployed. Deploying the current index...")
         retry_deploy_loop()
     except FailedPrecondition as e:
         if "retry again later" in str(e).lower() or "being undeployed" in str(e).lower():
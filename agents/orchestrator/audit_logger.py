@@ -9,6 +9,8 @@ from typing import Any, Dict, List, Optional
 
 from google.cloud import bigquery
 
+from .bigquery_client import get_bq_client
+
 
 # Table schema: one row per tool invocation
 AUDIT_SCHEMA = [
@@ -33,7 +35,7 @@ def ensure_audit_dataset_and_table(
     credentials=None,
 ) -> None:
     """Create the audit dataset and table if they do not exist. Same region as other data."""
-    client = bigquery.Client(project=project_id, credentials=credentials)
+    client = get_bq_client(project_id, credentials)
     full_dataset_id = f"{project_id}.{dataset_id}"
     try:
         client.get_dataset(full_dataset_id)
@@ -60,7 +62,7 @@ def write_audit_rows(
     if not rows:
         return
     try:
-        client = bigquery.Client(project=project_id, credentials=credentials)
+        client = get_bq_client(project_id, credentials)
         table_ref = f"{project_id}.{dataset_id}.{table_id}"
         errors = client.insert_rows_json(table_ref, rows)
         if errors:
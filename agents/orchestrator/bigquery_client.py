@@ -0,0 +1,29 @@
+"""
+Shared BigQuery client for the orchestrator: the Salesforce and Domo tools and the audit writer.
+One bigquery.Client per (project, credentials) for the whole process, so every query reuses the
+same HTTP session and token instead of building a new client.
+"""
+import functools
+
+from google.cloud import bigquery
+
+
+@functools.lru_cache(maxsize=1)
+def default_credentials():
+    """google.auth.default() credentials, resolved once per process. A fresh lookup per call
+    would hand get_bq_client a new object each time and miss its cache."""
+    import google.auth
+    credentials, _ = google.auth.default()
+    return credentials
+
+
+@functools.lru_cache(maxsize=4)
+def _cached_client(project_id: str, credentials) -> bigquery.Client:
+    return bigquery.Client(project=project_id, credentials=credentials)
+
+
+def get_bq_client(project_id: str, credentials=None) -> bigquery.Client:
+    """bigquery.Client for project_id, built once and reused. credentials=None uses default_credentials()."""
+    if credentials is None:
+        credentials = default_credentials()
+    return _cached_client(project_id, credentials)
@@ -7,6 +7,8 @@ Uses a custom execute_sql tool that records BigQuery bytes for cost display.
 """
 
 
+import functools
+import io
 import json
 import sys
 from pathlib import Path
@@ -22,12 +24,17 @@ from google.adk.agents import LlmAgent
 from google.adk.models import Gemini
 from google.adk.tools.function_tool import FunctionTool
 
+from .bigquery_client import get_bq_client
+
 # Schema lives next to this module in orchestrator/
 SCHEMA_FILE = Path(__file__).resolve().parent / "domo_schema.json"
 
 # Max rows to return (match typical ADK default)
 _MAX_QUERY_ROWS = 1000
 
+# Cell types json.dumps always accepts; only other values (date, Decimal, bytes, ...) need the probe
+_JSON_SCALAR_TYPES = (str, int, float, bool, type(None))
+
 # Credentials for BigQuery (set by create_domo_agent so tool uses same creds as orchestrator)
 _bq_credentials = None
 
@@ -38,7 +45,6 @@ def execute_sql(project_id: str, query: str) -> dict:
     """
     from .usage_collector import record_bigquery
     from .audit_context import append_audit_entry
-    import google.auth
     try:
         if project_id != config.PROJECT_ID:
             err = (
@@ -47,11 +53,8 @@ def execute_sql(project_id: str, query: str) -> dict:
             )
             append_audit_entry("execute_sql", query, None, err)
             return {"status": "ERROR", "error_details": err}
-        creds = _bq_credentials
-        if creds is None:
-            creds, _ = google.auth.default()
         # Do not set location so BigQuery uses dataset location (domo_test_dataset may be in US multi-region)
-        client = bigquery.Client(project=project_id, credentials=creds)
+        client = get_bq_client(project_id, _bq_credentials)
         # Dry run to enforce SELECT-only
         dry_run_job = client.query(
             query,
@@ -68,13 +71,16 @@ def execute_sql(project_id: str, query: str) -> dict:
         )
         rows_iter = job.result(max_results=_MAX_QUERY_ROWS)
         rows = []
+        # Column names come from the result schema once; Row.items() deep-copies cell by cell
+        field_names = [field.name for field in rows_iter.schema]
         for row in rows_iter:
             row_values = {}
-            for key, val in row.items():
-                try:
-                    json.dumps(val)
-                except (TypeError, ValueError):
-                    val = str(val)
+            for key, val in zip(field_names, row.values()):
+                if not isinstance(val, _JSON_SCALAR_TYPES):
+                    try:
+                        json.dumps(val)
+                    except (TypeError, ValueError):
+                        val = str(val)
                 row_values[key] = val
             rows.append(row_values)
         bytes_processed = job.total_bytes_processed or 0
@@ -94,12 +100,8 @@ def get_pod_data_by_id(pod_id: int) -> dict:
     Use this when you have a pod_id from Salesforce data and need to get the corresponding Domo metrics."""
     from .usage_collector import record_bigquery
     from .audit_context import append_audit_entry
-    import google.auth
     try:
-        creds = _bq_credentials
-        if creds is None:
-            creds, _ = google.auth.default()
-        client = bigquery.Client(project=config.PROJECT_ID, credentials=creds)
+        client = get_bq_client(config.PROJECT_ID, _bq_credentials)
 
         q_pod = f"""
         SELECT pretty_name, meau, provisioned_users, active_users, health_score,
@@ -148,21 +150,27 @@ def get_pod_data_by_id(pod_id: int) -> dict:
         }
 
 
+@functools.lru_cache(maxsize=8)
+def _load_schema_context(path_str: str, mtime_ns: int) -> str:
+    """Parse the schema JSON into instruction text. Cached per (path, mtime) so an edited file is re-read."""
+    with open(path_str, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    tables = data.get("datasets", [{}])[0].get("tables", [])
+    buf = io.StringIO()
+    buf.write("# DATABASE SCHEMA (domo_test_dataset)")
+    for t in tables:
+        buf.write(f"\n## Table: {t['table_id']}")
+        buf.writelines(f"\n- {c['column_name']} ({c['data_type']})" for c in t.get("schema", []))
+    return buf.getvalue()
+
+
 def get_schema_context(path: Path = None) -> str:
     """Load domo_test_dataset schema from JSON for the agent instruction (full schema for SQL)."""
     path = path or SCHEMA_FILE
     if not path.exists():
         return "Note: domo_schema.json not found. Use standard Domo naming conventions."
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        tables = data.get("datasets", [{}])[0].get("tables", [])
-        lines = ["# DATABASE SCHEMA (domo_test_dataset)"]
-        for t in tables:
-            lines.append(f"## Table: {t['table_id']}")
-            for c in t.get("schema", []):
-                lines.append(f"- {c['column_name']} ({c['data_type']})")
-        return "\n".join(lines)
+        return _load_schema_context(str(path), path.stat().st_mtime_ns)
     except Exception as e:
         return f"Schema load error: {e}"
 
@@ -5,6 +5,8 @@ Uses root config.py for project, location, and model.
 Exports create_salesforce_agent(credentials) for the orchestrator.
 Uses a custom execute_sql tool that records BigQuery bytes for cost display.
 """
+import functools
+import io
 import json
 import sys
 from datetime import date, datetime
@@ -21,12 +23,20 @@ from google.adk.agents import LlmAgent
 from google.adk.models import Gemini
 from google.adk.tools.function_tool import FunctionTool
 
+from .bigquery_client import get_bq_client
+
 # Schema lives next to this module in orchestrator/
 SCHEMA_FILE = Path(__file__).resolve().parent / "nexus_schema.json"
 
 # Max rows to return (match typical ADK default)
 _MAX_QUERY_ROWS = 1000
 
+# Accounts in the all-accounts snapshot (the test_pod lookup is limited to the same accounts)
+_MAX_SNAPSHOT_ACCOUNTS = 500
+
+# Cell types json.dumps always accepts; only other values (date, Decimal, bytes, ...) need the probe
+_JSON_SCALAR_TYPES = (str, int, float, bool, type(None))
+
 # Credentials for BigQuery (set by create_salesforce_agent so tool uses same creds as orchestrator)
 _bq_credentials = None
 
@@ -36,7 +46,11 @@ def _engagement_from_task_count(task_count_val) -> str:
     if task_count_val is None:
         return "Engagement: N/A"
     try:
-        task_count = int(float(str(task_count_val).strip()))
+        # BigQuery returns INT64 columns as int; only strings/floats need the parse round-trip
+        if type(task_count_val) is int:
+            task_count = task_count_val
+        else:
+            task_count = int(float(str(task_count_val).strip()))
         if task_count >= 4:
             return f"Engagement: Task Count: {task_count}. Sentiment: Positive."
         elif task_count == 0:
@@ -49,13 +63,47 @@ def _engagement_from_task_count(task_count_val) -> str:
         return "Engagement: N/A"
 
 
+def _expansion_signal(provisioned_users, contracted_licenses) -> str:
+    """Expansion Signal: 'Positive' if provisioned_users > 90% of contracted_licenses, else 'Negative'; 'N/A' if unknown."""
+    # Check if both values exist and are valid numbers
+    if provisioned_users is None or contracted_licenses is None:
+        return "N/A"
+    try:
+        provisioned_users_val = float(provisioned_users)
+        contracted_licenses_val = float(contracted_licenses)
+    except (ValueError, TypeError, AttributeError):
+        # If conversion fails, keep as N/A
+        return "N/A"
+    # Only compare against the threshold if contracted_licenses > 0 (avoid division by zero)
+    if contracted_licenses_val > 0:
+        return "Positive" if provisioned_users_val > (0.9 * contracted_licenses_val) else "Negative"
+    if contracted_licenses_val == 0:
+        # If contracted is 0, any provisioned users is positive; both 0 is negative
+        return "Positive" if provisioned_users_val > 0 else "Negative"
+    return "N/A"
+
+
+def _format_arr(arr) -> str:
+    """Format Total_ARR as '$1,234'. Accepts numbers or currency strings like '$1,234.50'; 'N/A' if missing or unparseable."""
+    if arr is None or arr == "":
+        return "N/A"
+    if isinstance(arr, str):
+        try:
+            arr = float(arr.replace("$", "").replace(",", "").strip())
+        except ValueError:
+            return "N/A"
+    try:
+        return f"${int(arr):,}"
+    except (ValueError, TypeError, OverflowError):
+        return "N/A"
+
+
 def execute_sql(project_id: str, query: str) -> dict:
     """Run a read-only BigQuery SQL query. Records bytes processed for cost display.
     Use fully qualified names: `project_id.nexus_data.TABLE_NAME`.
     """
     from .usage_collector import record_bigquery
     from .audit_context import append_audit_entry
-    import google.auth
     try:
         if project_id != config.PROJECT_ID:
             err = (
@@ -64,11 +112,8 @@ def execute_sql(project_id: str, query: str) -> dict:
             )
             append_audit_entry("execute_sql", query, None, err)
             return {"status": "ERROR", "error_details": err}
-        creds = _bq_credentials
-        if creds is None:
-            creds, _ = google.auth.default()
         # Do not set location so BigQuery uses dataset location (nexus_data may be in US multi-region)
-        client = bigquery.Client(project=project_id, credentials=creds)
+        client = get_bq_client(project_id, _bq_credentials)
         # Dry run to enforce SELECT-only
         dry_run_job = client.query(
             query,
@@ -85,13 +130,16 @@ def execute_sql(project_id: str, query: str) -> dict:
         )
         rows_iter = job.result(max_results=_MAX_QUERY_ROWS)
         rows = []
+        # Column names come from the result schema once; Row.items() deep-copies cell by cell
+        field_names = [field.name for field in rows_iter.schema]
         for row in rows_iter:
             row_values = {}
-            for key, val in row.items():
-                try:
-                    json.dumps(val)
-                except (TypeError, ValueError):
-                    val = str(val)
+            for key, val in zip(field_names, row.values()):
+                if not isinstance(val, _JSON_SCALAR_TYPES):
+                    try:
+                        json.dumps(val)
+                    except (TypeError, ValueError):
+                        val = str(val)
                 row_values[key] = val
             rows.append(row_values)
         bytes_processed = job.total_bytes_processed or 0
@@ -111,12 +159,8 @@ def get_salesforce_account_data(account_name: str) -> dict:
     Returns a dict with Salesforce data and pod_id. Use this when you need to get pod_id to query Domo agent."""
     from .usage_collector import record_bigquery
     from .audit_context import append_audit_entry
-    import google.auth
     try:
-        creds = _bq_credentials
-        if creds is None:
-            creds, _ = google.auth.default()
-        client = bigquery.Client(project=config.PROJECT_ID, credentials=creds)
+        client = get_bq_client(config.PROJECT_ID, _bq_credentials)
 
         # Query test_dataset2 for Salesforce data
         safe_name = account_name.replace("'", "''")
@@ -213,7 +257,7 @@ def get_nexus_account_snapshot(account_name: str) -> str:
         arr = salesforce_data.get("total_arr")
         renewal = salesforce_data.get("renewal_date") or "N/A"
         owner = salesforce_data.get("account_owner") or "N/A"
-        arr_str = f"${int(arr):,}" if arr is not None and arr != "" else "N/A"
+        arr_str = _format_arr(arr)
         parts.append(f"• Commercial: {arr_str} ARR | Renewal: {renewal} | Owner: {owner}")
 
         # Adoption — N/A for now
@@ -238,29 +282,7 @@ def get_nexus_account_snapshot(account_name: str) -> str:
         risk = pod_data.get("risk_ratio_for_next_renewal")
         
         # Expansion Signal: provisioned_users > 90% of contracted_licenses from test_pod
-        expansion_signal = "N/A"
-        provisioned_users = pod_data.get("provisioned_users")
-        contracted_licenses = pod_data.get("contracted_licenses")
-        # Check if both values exist and are valid numbers
-        if provisioned_users is not None and contracted_licenses is not None:
-            try:
-                provisioned_users_val = float(provisioned_users)
-                contracted_licenses_val = float(contracted_licenses)
-                # Only calculate if contracted_licenses > 0 (avoid division by zero)
-                if contracted_licenses_val > 0:
-                    if provisioned_users_val > (0.9 * contracted_licenses_val):
-                        expansion_signal = "Positive"
-                    else:
-                        expansion_signal = "Negative"
-                elif contracted_licenses_val == 0 and provisioned_users_val > 0:
-                    # If contracted is 0 but provisioned > 0, it's positive
-                    expansion_signal = "Positive"
-                elif contracted_licenses_val == 0:
-                    # If both are 0, it's negative
-                    expansion_signal = "Negative"
-            except (ValueError, TypeError, AttributeError):
-                # If conversion fails, keep as N/A
-                pass
+        expansion_signal = _expansion_signal(pod_data.get("provisioned_users"), pod_data.get("contracted_licenses"))
         
         insights = []
         # ORBIT score = health_score from test_pod
@@ -299,7 +321,7 @@ def _format_single_snapshot(client_name: str, account_row: dict, pod_row: dict)
     arr = account_row.get("Total_ARR")
     renewal = account_row.get("Renewal_Date") or "N/A"
     owner = account_row.get("Account_Owner") or "N/A"
-    arr_str = f"${int(arr):,}" if arr is not None and arr != "" else "N/A"
+    arr_str = _format_arr(arr)
     parts.append(f"• Commercial: {arr_str} ARR | Renewal: {renewal} | Owner: {owner}")
     parts.append("• Adoption: N/A")
     meau_val = pod_row.get("meau") if pod_row else None
@@ -313,28 +335,7 @@ def _format_single_snapshot(client_name: str, account_row: dict, pod_row: dict)
     # Expansion Signal: provisioned_users > 90% of contracted_licenses from test_pod
     expansion_signal = "N/A"
     if pod_row:
-        provisioned_users = pod_row.get("provisioned_users")
-        contracted_licenses = pod_row.get("contracted_licenses")
-        # Check if both values exist and are valid numbers
-        if provisioned_users is not None and contracted_licenses is not None:
-            try:
-                provisioned_users_val = float(provisioned_users)
-                contracted_licenses_val = float(contracted_licenses)
-                # Only calculate if contracted_licenses > 0 (avoid division by zero)
-                if contracted_licenses_val > 0:
-                    if provisioned_users_val > (0.9 * contracted_licenses_val):
-                        expansion_signal = "Positive"
-                    else:
-                        expansion_signal = "Negative"
-                elif contracted_licenses_val == 0 and provisioned_users_val > 0:
-                    # If contracted is 0 but provisioned > 0, it's positive
-                    expansion_signal = "Positive"
-                elif contracted_licenses_val == 0:
-                    # If both are 0, it's negative
-                    expansion_signal = "Negative"
-            except (ValueError, TypeError, AttributeError):
-                # If conversion fails, keep as N/A
-                pass
+        expansion_signal = _expansion_signal(pod_row.get("provisioned_users"), pod_row.get("contracted_licenses"))
     
     insights = []
     # ORBIT score = health_score from test_pod
@@ -364,23 +365,49 @@ def get_all_nexus_account_snapshots() -> str:
     'give me all accounts', etc."""
     from .usage_collector import record_bigquery
     from .audit_context import append_audit_entry
-    import google.auth
     try:
-        creds = _bq_credentials
-        if creds is None:
-            creds, _ = google.auth.default()
-        client = bigquery.Client(project=config.PROJECT_ID, credentials=creds)
+        client = get_bq_client(config.PROJECT_ID, _bq_credentials)
 
-        # 1) All accounts from test_dataset2
+        # 1) Accounts from test_dataset2. POD_Internal_Id__c breaks Customer_Name ties so the pod
+        # subquery below selects exactly the same accounts.
+        account_order = f"ORDER BY Customer_Name, POD_Internal_Id__c LIMIT {_MAX_SNAPSHOT_ACCOUNTS}"
         q_account = f"""
         SELECT Customer_Name, Total_ARR, Renewal_Date, Account_Owner, POD_Internal_Id__c, Task_Count
         FROM `{config.PROJECT_ID}.nexus_data.test_dataset2`
-        ORDER BY Customer_Name
+        {account_order}
+        """
+        # 2) Latest test_pod row for every pod referenced by those accounts. The pod_id list is taken in SQL
+        # (same int(float(...)) truncation as below) so this job can run alongside the accounts query.
+        # ARRAY_AGG ... LIMIT 1 keeps one row per group instead of numbering every row.
+        q_pod = f"""
+        SELECT latest.*
+        FROM (
+            SELECT ARRAY_AGG(
+                       STRUCT(pod_id, meau, health_score, risk_ratio_for_next_renewal, provisioned_users, contracted_licenses)
+                       ORDER BY `month` DESC LIMIT 1
+                   )[OFFSET(0)] AS latest
+            FROM `{config.PROJECT_ID}.domo_test_dataset.test_pod`
+            WHERE pod_id IN (
+                SELECT SAFE_CAST(TRUNC(SAFE_CAST(TRIM(POD_Internal_Id__c) AS FLOAT64)) AS INT64)
+                FROM (
+                    SELECT Customer_Name, POD_Internal_Id__c
+                    FROM `{config.PROJECT_ID}.nexus_data.test_dataset2`
+                    {account_order}
+                )
+            )
+            GROUP BY pod_id
+        )
         """
         account_rows = []
+        pod_job, pod_error = None, None
         try:
             job = client.query(q_account, project=config.PROJECT_ID)
-            account_rows = list(job.result(max_results=500))
+            # Submit before waiting on the accounts job so both queries execute concurrently
+            try:
+                pod_job = client.query(q_pod, project=config.PROJECT_ID)
+            except Exception as e:
+                pod_error = e
+            account_rows = list(job.result(max_results=_MAX_SNAPSHOT_ACCOUNTS))
             record_bigquery(job.total_bytes_processed or 0)
             append_audit_entry("get_all_nexus_account_snapshots", q_account, job.total_bytes_processed or 0, None)
         except Exception as ex:
@@ -388,50 +415,35 @@ def get_all_nexus_account_snapshots() -> str:
             return f"Error fetching accounts: {ex}"
 
         if not account_rows:
-            return "No accounts found in test_dataset2."
-
-        # 2) Collect valid pod_ids and fetch test_pod data
-        pod_ids = []
-        for r in account_rows:
-            pid = r.get("POD_Internal_Id__c")
-            if pid is not None and str(pid).strip():
+            # Nothing to map the pod rows onto: stop the pod job instead of waiting for it
+            if pod_job is not None:
                 try:
-                    pod_ids.append(int(float(str(pid).strip())))
-                except (ValueError, TypeError):
+                    pod_job.cancel()
+                except Exception:
                     pass
+            return "No accounts found in test_dataset2."
+
         pod_id_to_row = {}
-        if pod_ids:
-            ids_str = ",".join(str(i) for i in pod_ids)
-            q_pod = f"""
-            SELECT pod_id, meau, health_score, risk_ratio_for_next_renewal, provisioned_users, contracted_licenses
-            FROM (
-                SELECT pod_id, meau, health_score, risk_ratio_for_next_renewal, provisioned_users, contracted_licenses, `month`,
-                       ROW_NUMBER() OVER (PARTITION BY pod_id ORDER BY `month` DESC) as rn
-                FROM `{config.PROJECT_ID}.domo_test_dataset.test_pod`
-                WHERE pod_id IN ({ids_str})
-            )
-            WHERE rn = 1
-            """
+        if pod_job is not None:
             try:
-                job = client.query(q_pod, project=config.PROJECT_ID)
-                for row in job.result(max_results=500):
-                    pod_id_to_row[row["pod_id"]] = dict(row)
-                record_bigquery(job.total_bytes_processed or 0)
-                append_audit_entry("get_all_nexus_account_snapshots", q_pod, job.total_bytes_processed or 0, None)
+                # Row already supports .get(), so keep it instead of copying each one into a dict
+                pod_id_to_row = {row["pod_id"]: row for row in pod_job.result(max_results=_MAX_SNAPSHOT_ACCOUNTS)}
+                record_bigquery(pod_job.total_bytes_processed or 0)
+                append_audit_entry("get_all_nexus_account_snapshots", q_pod, pod_job.total_bytes_processed or 0, None)
             except Exception as e:
-                append_audit_entry("get_all_nexus_account_snapshots", q_pod, None, str(e))
-                pass
+                pod_error = e
+        if pod_error is not None:
+            append_audit_entry("get_all_nexus_account_snapshots", q_pod, None, str(pod_error))
 
         # 3) Format each account
         outputs = []
         for r in account_rows:
             client_name = str(r.get("Customer_Name") or "Unknown")
-            pod_id_val = r.get("POD_Internal_Id__c")
+            pid = r.get("POD_Internal_Id__c")
             pod_row = None
-            if pod_id_val is not None and str(pod_id_val).strip():
+            if pid is not None and str(pid).strip():
                 try:
-                    pid = int(float(str(pod_id_val).strip()))
-                    pod_row = pod_id_to_row.get(pid)
+                    pod_row = pod_id_to_row.get(int(float(str(pid).strip())))
                 except (ValueError, TypeError):
                     pass
             outputs.append(_format_single_snapshot(client_name, r, pod_row))
@@ -441,21 +453,27 @@ def get_all_nexus_account_snapshots() -> str:
         return f"Error fetching all Nexus Account Snapshots: {ex}"
 
 
+@functools.lru_cache(maxsize=8)
+def _load_schema_context(path_str: str, mtime_ns: int) -> str:
+    """Parse the schema JSON into instruction text. Cached per (path, mtime) so an edited file is re-read."""
+    with open(path_str, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    tables = data.get("datasets", [{}])[0].get("tables", [])
+    buf = io.StringIO()
+    buf.write("# DATABASE SCHEMA (nexus_data)")
+    for t in tables:
+        buf.write(f"\n## Table: {t['table_id']}")
+        buf.writelines(f"\n- {c['column_name']} ({c['data_type']})" for c in t.get("schema", []))
+    return buf.getvalue()
+
+
 def get_schema_context(path: Path = None) -> str:
     """Load nexus_data schema from JSON for the agent instruction (full schema for SQL)."""
     path = path or SCHEMA_FILE
     if not path.exists():
         return "Note: nexus_schema.json not found. Use standard Salesforce naming conventions."
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        tables = data.get("datasets", [{}])[0].get("tables", [])
-        lines = ["# DATABASE SCHEMA (nexus_data)"]
-        for t in tables:
-            lines.append(f"## Table: {t['table_id']}")
-            for c in t.get("schema", []):
-                lines.append(f"- {c['column_name']} ({c['data_type']})")
-        return "\n".join(lines)
+        return _load_schema_context(str(path), path.stat().st_mtime_ns)
     except Exception as e:
         return f"Schema load error: {e}"
 
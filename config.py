@@ -61,6 +61,8 @@ PDF_URL_LIST = (
     "https://goto.symphony.com/rs/945-HBF-959/images/SYM_2025_1PGR_Symphony_for_Wealth%20Management.pdf?version=0",
     ]
 )
+# URLs streamed to GCS in parallel (each is an independent HTTP download + GCS upload).
+INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", "8"))
 
 # ================= PHASE 2: CHUNKING =================
 # Bucket/prefix for chunks (Phase 2 writes here; Phase 3 reads from here).
@@ -73,6 +75,11 @@ CHUNK_OVERLAP_RATIO = float(os.environ.get("CHUNK_OVERLAP_RATIO", "0.12"))
 VECTOR_INDEX_DISPLAY_NAME = "doc-pipeline-index"
 EMBEDDING_MODEL = "text-embedding-004"
 EMBEDDINGS_GCS_PREFIX = "embeddings"
+# Embedding quota Phase 3 paces itself to (requests and estimated tokens per minute; 4 chars ≈ 1 token).
+EMBED_REQUESTS_PER_MINUTE = int(os.environ.get("EMBED_REQUESTS_PER_MINUTE", "60"))
+EMBED_TOKENS_PER_MINUTE = int(os.environ.get("EMBED_TOKENS_PER_MINUTE", "300000"))
+# Embedding requests Phase 3 keeps in flight (default for --concurrency); raise with a higher quota above.
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "5"))
 
 # ================= PHASE 4: DEPLOY & ADK =================
 # Vector Search index (from Phase 3 output). Latest: 1,744 chunks → index 8645508307714310144.
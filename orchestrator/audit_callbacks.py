@@ -96,9 +96,9 @@ async def after_agent_audit_callback(*, callback_context: "CallbackContext") ->
     if not rows:
         return None
     try:
-        import google.auth
         from google.auth.transport import requests as google_requests
-        credentials, _ = google.auth.default()
+        from orchestrator.bigquery_client import default_credentials
+        credentials = default_credentials()
         if not credentials.valid:
             credentials.refresh(google_requests.Request())
     except Exception:
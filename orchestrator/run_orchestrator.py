@@ -5,7 +5,9 @@ Combined questions (PDF + Salesforce + Domo in one) are answered with: ask separ
 """
 import asyncio
 import json
+import re
 import sys
+import threading
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
@@ -30,7 +32,7 @@ from google.adk.auth.credential_service.in_memory_credential_service import InMe
 from google.adk.utils.context_utils import Aclosing
 from google.genai import types
 
-from orchestrator.pdf_agent import create_pdf_agent
+from orchestrator.pdf_agent import create_pdf_agent, warm_up_retrieval
 from orchestrator.salesforce_agent import create_salesforce_agent, get_salesforce_account_data
 from orchestrator.domo_agent import create_domo_agent, get_pod_data_by_id
 from orchestrator.usage_collector import clear as usage_clear
@@ -46,6 +48,38 @@ SALESFORCE_SCHEMA_FILE = Path(__file__).resolve().parent / "nexus_schema.json"
 DOMO_SCHEMA_FILE = Path(__file__).resolve().parent / "domo_schema.json"
 
 
+async def _read_input(prompt: str) -> str:
+    """input() on a daemon thread so the event loop keeps running while the user types.
+    A daemon thread (not asyncio.to_thread) so Ctrl+C / exit never waits on a pending read."""
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+
+    def _settle(result=None, exc=None):
+        if fut.done():
+            return
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+
+    def _read():
+        try:
+            line = input(prompt)
+        except Exception as e:  # EOFError when stdin closes
+            loop.call_soon_threadsafe(_settle, None, e)
+        else:
+            loop.call_soon_threadsafe(_settle, line)
+
+    threading.Thread(target=_read, name="repl-input", daemon=True).start()
+    return await fut
+
+
+def _user_message(text: str) -> types.Content:
+    """User turn for runner.run_async. Built with model_construct: the fields are known-good,
+    so the per-turn pydantic validation of Content/Part is skipped."""
+    return types.Content.model_construct(role="user", parts=[types.Part.model_construct(text=text)])
+
+
 def _print_cost_breakdown(tasks: list) -> None:
     """Print per-task cost breakdown and total (terminal only). Uses config pricing."""
     if not tasks:
@@ -119,23 +153,28 @@ _DOCUMENT_KEYWORDS = (
     "federation", "insurance giants", "wealth management",
 )
 
+# Each keyword tuple compiled into one alternation so routing is a single regex scan per question
+_SALESFORCE_KEYWORDS_RE = re.compile("|".join(map(re.escape, _SALESFORCE_KEYWORDS)))
+_DOCUMENT_KEYWORDS_RE = re.compile("|".join(map(re.escape, _DOCUMENT_KEYWORDS)))
+_DOMO_KEYWORDS_RE = re.compile("|".join(map(re.escape, _DOMO_KEYWORDS)))
+
 
 def _is_likely_salesforce_question(text: str) -> bool:
     """True if the question clearly asks about Salesforce/BigQuery data (not the PDF)."""
     lower = text.lower().strip()
-    return any(kw in lower for kw in _SALESFORCE_KEYWORDS)
+    return _SALESFORCE_KEYWORDS_RE.search(lower) is not None
 
 
 def _is_likely_document_question(text: str) -> bool:
     """True if the question is clearly about the uploaded document/PDF (not Salesforce or Domo)."""
     lower = text.lower().strip()
-    return any(kw in lower for kw in _DOCUMENT_KEYWORDS)
+    return _DOCUMENT_KEYWORDS_RE.search(lower) is not None
 
 
 def _is_likely_domo_question(text: str) -> bool:
     """True if the question clearly asks about Domo/BigQuery data (not the PDF or Salesforce)."""
     lower = text.lower().strip()
-    return any(kw in lower for kw in _DOMO_KEYWORDS)
+    return _DOMO_KEYWORDS_RE.search(lower) is not None
 
 
 def _maybe_add_routing_hint(user_message: str) -> str:
@@ -446,12 +485,15 @@ async def main():
         user_id="user",
     )
 
+    # Overlap PDF retrieval setup (chunks download, embedding model, endpoint lookup) with the user typing
+    threading.Thread(target=warm_up_retrieval, name="pdf-warmup", daemon=True).start()
+
     print("\n  Ready. Ask about documents (PDF), Salesforce/BigQuery data, or Domo/BigQuery data.")
     print("  Type 'exit' to quit.\n")
 
     while True:
         try:
-            user_input = input("You: ").strip()
+            user_input = (await _read_input("You: ")).strip()
             if user_input.lower() in ("exit", "quit"):
                 break
             if not user_input:
@@ -472,11 +514,12 @@ async def main():
             turn_start_utc = datetime.now(timezone.utc)
             set_turn_context(session_id, turn_id, user_input, routing_hint, turn_start_utc)
 
-            msg = types.Content(role="user", parts=[types.Part(text=message_to_send)])
+            msg = _user_message(message_to_send)
             print("Assistant: ", end="", flush=True)
 
             usage_clear()
             response_parts = []
+            write = sys.stdout.write
             async with Aclosing(
                 runner.run_async(
                     user_id="user",
@@ -492,13 +535,22 @@ async def main():
                             getattr(um, "prompt_token_count", None) or 0,
                             getattr(um, "candidates_token_count", None) or 0,
                         )
-                    if event.content and event.content.parts:
-                        for part in event.content.parts:
-                            if part.text:
-                                response_parts.append(part.text)
-                                print(part.text, end="", flush=True)
-                            if getattr(part, "function_call", None):
-                                print(f"\n  [Calling {getattr(part.function_call, 'name', 'tool')}...]", flush=True)
+                    content = event.content
+                    if not content:
+                        continue
+                    parts = content.parts
+                    if not parts:
+                        continue
+                    for part in parts:
+                        text = part.text
+                        if text:
+                            response_parts.append(text)
+                            write(text)
+                        fc = getattr(part, "function_call", None)
+                        if fc:
+                            write(f"\n  [Calling {getattr(fc, 'name', 'tool')}...]\n")
+                    # One flush per event instead of per part
+                    sys.stdout.flush()
             assistant_response = "".join(response_parts)
 
             if config.AUDIT_ENABLED:
@@ -519,7 +571,8 @@ async def main():
             tasks = usage_get_and_clear()
             _print_cost_breakdown(tasks)
             print("")
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError, asyncio.CancelledError):
+            # asyncio.run turns Ctrl+C into cancellation of this coroutine
             break
         except Exception as e:
             print(f"\n  Error: {e}")